@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# time how long it takes to build the toolbox browser tree for a large,
+# synthetic parts library. Run this as a macro, or from the FreeCAD
+# python console with:
+#   exec(open("/path/to/Benchmark/bench_browser_tree.py").read())
+#
+
+import time
+from PySide import QtGui
+from PTb_LibraryModel import PartLibraryModel
+
+
+def syntheticParts(count, categories=10, depth=3):
+    """
+    make up 'count' (file path, [categories]) tuples, spread evenly
+    over 'categories' folders on each of 'depth' levels
+    """
+    parts = []
+    for n in range(count):
+        cats = [f"Category {(n // categories**level) % categories}"
+                for level in range(depth)]
+        parts.append((f"/library/Part {n:05d}.FCStd", cats))
+    return parts
+
+
+def benchTree(parts):
+    """
+    build a fresh tree from 'parts' and show it in a tree view.
+    return the time it took in seconds
+    """
+    start = time.perf_counter()
+    model = PartLibraryModel()
+    model.addParts(parts)
+    view = QtGui.QTreeView()
+    view.setModel(model)
+    # make the view ask for the top level rows, as it would on screen
+    view.model().rowCount()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    for label, parts in [
+            ("nested, 10x10x10 categories", syntheticParts(10000)),
+            ("flat, 1 category", syntheticParts(10000, depth=1, categories=1))]:
+        print(f"browser tree, 10000 parts, {label}: "
+              f"{benchTree(parts)*1000:.1f} ms")
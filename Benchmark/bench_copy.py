@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# compare copying a library part into a document through the clipboard
+# (Std_Copy/Std_Paste, as the "Copy object" import mode used to) with
+# Document.copyObject. The clipboard needs the FreeCAD GUI, without it
+# only copyObject is timed. Run this as a macro, from the FreeCAD python
+# console with:
+#   exec(open("/path/to/Benchmark/bench_copy.py").read())
+# or headless with:
+#   FreeCADCmd Benchmark/bench_copy.py
+# The times are printed to the Report view (or stdout) and returned by
+# main() as a {(part, method): seconds} dict
+#
+
+import os
+import time
+import FreeCAD
+from PTb_Base import objpath
+from PTb_FCFileTools import getPartObject
+
+partNames = [
+    "Hexagon socket head cap screw - ISO 4762",
+    "THR_H_BEM_SFT",
+]
+
+
+def copyByClipboard(doc, top_obj):
+    FreeCAD.Gui.Selection.clearSelection()
+    for x in [top_obj] + top_obj.OutListRecursive:
+        FreeCAD.Gui.Selection.addSelection(x)
+    FreeCAD.Gui.runCommand("Std_Copy")
+    FreeCAD.Gui.Selection.clearSelection()
+    FreeCAD.setActiveDocument(doc.Name)
+    FreeCAD.Gui.runCommand("Std_Paste", 0)
+
+
+def copyDirectly(doc, top_obj):
+    doc.copyObject(top_obj, True)
+
+
+def benchCopy(copyFunc, top_obj, repeat=5):
+    """
+    copy top_obj into a new document 'repeat' times.
+    return the average time per copy in seconds
+    """
+    doc = FreeCAD.newDocument("PTbBenchCopy")
+    start = time.perf_counter()
+    for n in range(repeat):
+        copyFunc(doc, top_obj)
+    elapsed = (time.perf_counter() - start) / repeat
+    FreeCAD.closeDocument(doc.Name)
+    return elapsed
+
+
+def main(repeat=5):
+    """
+    time the ways of copying each part in partNames that work here
+    """
+    results = {}
+    methods = [("copyObject", copyDirectly)]
+    if FreeCAD.GuiUp:
+        methods.insert(0, ("clipboard", copyByClipboard))
+    for name in partNames:
+        partDoc = FreeCAD.openDocument(os.path.join(objpath, name),
+                                       hidden=True)
+        top_obj = getPartObject(partDoc)
+        for label, func in methods:
+            results[(name, label)] = benchCopy(func, top_obj, repeat)
+            FreeCAD.Console.PrintMessage(
+                f"copy {name}, {label}: "
+                f"{results[(name, label)]*1000:.1f} ms\n")
+        if FreeCAD.GuiUp:
+            speedup = results[(name, "clipboard")] / \
+                results[(name, "copyObject")]
+            FreeCAD.Console.PrintMessage(
+                f"copy {name}: copyObject is {speedup:.1f}x as fast as "
+                "the clipboard\n")
+        FreeCAD.closeDocument(partDoc.Name)
+    return results
+
+
+if __name__ == "__main__":
+    main()
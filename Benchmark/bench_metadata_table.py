@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# time how long it takes to fill the metadata editor table. Run this
+# as a macro, or from the FreeCAD python console with:
+#   exec(open("/path/to/Benchmark/bench_metadata_table.py").read())
+#
+
+import time
+from PySide import QtGui
+from PTb_PartMetaBrowser import (PartMetadataModel, PartMetadataFilter,
+                                 sampleColumnWidths)
+
+
+def syntheticRecords(count):
+    """
+    make up 'count' (file path, index record) pairs
+    """
+    return [(f"/library/Part {n:05d}.FCStd",
+             {"Type": f"Category {n % 10}|Category {n // 10 % 10}",
+              "Id": f"PN-{n:05d}", "License": "CC0-1.0",
+              "LicenseURL": "https://creativecommons.org/publicdomain/zero/1.0/"})
+            for n in range(count)]
+
+
+def benchTable(records):
+    """
+    build the metadata table for 'records' and show it in a table view.
+    return the time it took in seconds
+    """
+    start = time.perf_counter()
+    model = PartMetadataModel(records)
+    proxy = PartMetadataFilter()
+    proxy.setSourceModel(model)
+    view = QtGui.QTableView()
+    view.setModel(proxy)
+    sampleColumnWidths(view, model)
+    view.model().rowCount()
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    print(f"metadata table, 10000 parts: "
+          f"{benchTable(syntheticRecords(10000))*1000:.1f} ms")
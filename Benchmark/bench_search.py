@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# time filter queries against a synthetic 10,000 part search index.
+# Needs neither FreeCAD nor Qt:
+#   python Benchmark/bench_search.py
+#
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from PTb_Search import LibrarySearchIndex  # noqa: E402
+
+kinds = ["Hexagon socket head cap screw", "Hex nut", "Normal plain washer",
+         "Countersunk flat head screw", "Parallel pin", "Split pin"]
+standards = ["ISO 4762", "ISO 4032", "ISO 7089", "ISO 10642", "ISO 2338",
+             "ISO 1234", "DIN 471", "ASME B18"]
+sizes = ["M2", "M2.5", "M3", "M4", "M5", "M6", "M8", "M10", "M12"]
+
+
+def syntheticIndex(count):
+    index = LibrarySearchIndex()
+    for n in range(count):
+        kind = kinds[n % len(kinds)]
+        standard = standards[(n // len(kinds)) % len(standards)]
+        size = sizes[(n // 7) % len(sizes)]
+        name = f"{kind} - {standard} - {size} - variant {n}"
+        index.add(f"/library/{name}.FCStd", name,
+                  ["Fasteners", kind.split()[-1].capitalize() + "s"],
+                  f"PN-{n:05d}")
+    return index
+
+
+if __name__ == "__main__":
+    start = time.perf_counter()
+    index = syntheticIndex(10000)
+    print(f"build index, 10000 parts: "
+          f"{(time.perf_counter()-start)*1000:.1f} ms")
+    for query in ["ISO 4762 M6", "hex", "washer 7089", "crew", "pn-0042",
+                  "M2.5", "socket head cap"]:
+        start = time.perf_counter()
+        hits = index.query(query, 500)
+        print(f"query {query!r}: {len(hits)} hits, "
+              f"{(time.perf_counter()-start)*1000:.2f} ms")
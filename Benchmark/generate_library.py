@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# make synthetic parts libraries of any size for the benchmarks, out of
+# the documents in ObjModels. Each generated document is a copy of one
+# of the real ones, with its own Id and Type, so the library has the
+# same mix of file sizes and layouts as the real thing. Links between
+# documents are pointed at other generated documents. Run
+#   python Benchmark/generate_library.py FOLDER COUNT [dir|fcstd] [small|large|mixed]
+# to make one by hand
+#
+
+import os
+import re
+import sys
+from zipfile import ZipFile, ZIP_DEFLATED
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(_here, "stubs"))
+sys.path.insert(0, os.path.dirname(_here))
+from PTb_Base import objpath  # noqa: E402
+from PTb_FCFileTools import (getFCFiles, documentMembers,  # noqa: E402
+                             patchMetadataXml)
+
+fileFormats = ("dir", "fcstd")
+documentSizes = ("small", "large", "mixed")
+_xlinkPattern = re.compile(rb'(<XLink\s+file=")[^"]+(")')
+
+
+def loadTemplates(documentSize="mixed"):
+    """
+    read the documents of the bundled library into memory, as a list of
+    {member file name: contents} dicts. 'small' and 'large' pick the
+    smallest or largest third of them, by total size
+    """
+    templates = []
+    for name in sorted(getFCFiles(objpath)):
+        docPath = os.path.join(objpath, name)
+        members = {}
+        for rel, path in documentMembers(docPath):
+            with open(path, 'rb') as f:
+                members[os.path.relpath(rel, name).replace(os.sep, "/")] \
+                    = f.read()
+        templates.append(members)
+    templates.sort(key=lambda x: sum(len(v) for v in x.values()))
+    third = max(1, len(templates) // 3)
+    if documentSize == "small":
+        return templates[:third]
+    if documentSize == "large":
+        return templates[-third:]
+    return templates
+
+
+def documentName(n, fileFormat):
+    return f"Part {n:05d}" + (".FCStd" if fileFormat == "fcstd" else "")
+
+
+def generateLibrary(folder, count, fileFormat="dir", documentSize="mixed",
+                    templates=None):
+    """
+    fill 'folder' with 'count' documents in the given format ('dir' or
+    'fcstd'). Returns the list of document paths
+    """
+    if templates is None:
+        templates = loadTemplates(documentSize)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for n in range(count):
+        members = dict(templates[n % len(templates)])
+        xmlData = members["Document.xml"]
+        try:
+            xmlData = patchMetadataXml(xmlData, {
+                "Id": f"BENCH-{n:05d}",
+                "Type": f"Benchmark|Group {n % 10}|Subgroup {n // 10 % 10}",
+            })
+        except ValueError:
+            pass
+        # link to an earlier document instead of the original target,
+        # so dependency chains stay within the library
+        target = documentName(n // 2, fileFormat).encode()
+        members["Document.xml"] = _xlinkPattern.sub(
+            lambda m: m.group(1) + target + m.group(2), xmlData)
+        docPath = os.path.join(folder, documentName(n, fileFormat))
+        if fileFormat == "fcstd":
+            with ZipFile(docPath, 'w', ZIP_DEFLATED) as zipped:
+                for member, data in members.items():
+                    zipped.writestr(member, data)
+        else:
+            for member, data in members.items():
+                path = os.path.join(docPath, member)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(data)
+        paths.append(docPath)
+    return paths
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if len(args) < 2:
+        sys.exit("usage: generate_library.py FOLDER COUNT "
+                 "[dir|fcstd] [small|large|mixed]")
+    generateLibrary(args[0], int(args[1]), *args[2:4])
@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# run the benchmark suite on synthetic libraries and save the results
+# as json, for comparing the performance of different commits. Uses
+# the FreeCAD stand-in in Benchmark/stubs, so it runs in plain python.
+# The tree and table benchmarks also need PySide2 or PySide6.
+#   python Benchmark/run_benchmarks.py --output results.json
+#   python Benchmark/run_benchmarks.py --sizes 100 1000 10000 --compare old.json
+#
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+_here = os.path.dirname(os.path.abspath(__file__))
+# worker processes import this module too, they share the folder
+_work = os.environ.get("PTB_BENCH_WORK") or \
+    tempfile.mkdtemp(prefix="PartsToolboxBench")
+os.environ["PTB_BENCH_WORK"] = _work
+os.environ.setdefault("PTB_BENCH_APPDATA", os.path.join(_work, "appdata"))
+sys.path.insert(0, os.path.join(_here, "stubs"))
+sys.path.insert(0, os.path.dirname(_here))
+sys.path.insert(0, _here)
+import PTb_FCFileTools  # noqa: E402
+from PTb_FCFileTools import (getFCFiles, getDataFromFCFile,  # noqa: E402
+                             getDocumentDependencies, copyFreeCADDocuments,
+                             placeCopy)
+from PTb_Library import LibraryIndex, indexFileName  # noqa: E402
+from PTb_Search import LibrarySearchIndex  # noqa: E402
+from generate_library import (generateLibrary, loadTemplates,  # noqa: E402
+                              fileFormats, documentSizes)
+
+# number of documents copied into a project by the copy benchmark
+copyCount = 50
+searchQueries = ["benchmark", "group 3", "part 00042", "subgroup", "bench-0"]
+
+
+def timed(func, repeat=1, setup=None):
+    """
+    the shortest time out of 'repeat' calls of func(), in seconds.
+    setup() is called before each, without being timed
+    """
+    best = None
+    for n in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def qtApplication():
+    """
+    a QApplication for the tree and table benchmarks, or None if there
+    are no Qt bindings
+    """
+    try:
+        from PySide import QtGui
+    except ImportError:
+        return None
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    return QtGui.QApplication.instance() or QtGui.QApplication([])
+
+
+def benchLibrary(root, paths, repeat, app):
+    """
+    run every benchmark on one generated library.
+    Returns a {benchmark name: seconds} dict
+    """
+    results = {}
+    results["getFCFiles"] = timed(lambda: getFCFiles(root), repeat)
+    results["getDataFromFCFile"] = timed(
+        lambda: [getDataFromFCFile(x) for x in paths], repeat)
+
+    def clearLinks():
+        PTb_FCFileTools._linkCache.clear()
+    results["dependencies"] = timed(
+        lambda: [getDocumentDependencies(x) for x in paths], repeat,
+        clearLinks)
+
+    def removeIndex():
+        if os.path.exists(os.path.join(root, indexFileName)):
+            os.remove(os.path.join(root, indexFileName))
+    results["index refresh, cold, 1 worker"] = timed(
+        lambda: LibraryIndex(root).refresh(workers=1), repeat, removeIndex)
+    results["index refresh, cold"] = timed(
+        lambda: LibraryIndex(root).refresh(), repeat, removeIndex)
+    results["index refresh, warm"] = timed(
+        lambda: LibraryIndex(root).refresh(), repeat)
+
+    project = os.path.join(_work, "project")
+
+    def removeProject():
+        shutil.rmtree(project, ignore_errors=True)
+    toCopy = paths[-copyCount:]
+    results["copy, cold"] = timed(
+        lambda: copyFreeCADDocuments(toCopy, project, placeCopy), repeat,
+        removeProject)
+    results["copy, unchanged"] = timed(
+        lambda: copyFreeCADDocuments(toCopy, project, placeCopy), repeat)
+    removeProject()
+
+    records = LibraryIndex(root).records()
+
+    def buildSearch():
+        index = LibrarySearchIndex()
+        for path, record in records:
+            index.add(path, os.path.basename(path), record["Categories"],
+                      record["Id"])
+        return index
+    results["search index"] = timed(buildSearch, repeat)
+    index = buildSearch()
+    results["search queries"] = timed(
+        lambda: [index.query(x, 500) for x in searchQueries], repeat)
+
+    if app is not None:
+        from bench_browser_tree import benchTree
+        from bench_metadata_table import benchTable
+        parts = [(path, record["Categories"]) for path, record in records]
+        results["tree"] = min(benchTree(parts) for n in range(repeat))
+        results["table"] = min(benchTable(records) for n in range(repeat))
+    return results
+
+
+def benchSynthetic(repeat, app):
+    """
+    the older benchmarks, on made up data instead of a library.
+    Returns a {benchmark name: seconds} dict
+    """
+    from bench_search import syntheticIndex
+    results = {"search index": timed(lambda: syntheticIndex(10000), repeat)}
+    index = syntheticIndex(10000)
+    results["search queries"] = timed(
+        lambda: [index.query(x, 500) for x in
+                 ["ISO 4762 M6", "hex", "washer 7089", "crew", "pn-0042"]],
+        repeat)
+    if app is not None:
+        from bench_browser_tree import syntheticParts, benchTree
+        from bench_metadata_table import syntheticRecords, benchTable
+        parts = syntheticParts(10000)
+        results["tree"] = min(benchTree(parts) for n in range(repeat))
+        records = syntheticRecords(10000)
+        results["table"] = min(benchTable(records) for n in range(repeat))
+    return results
+
+
+def gitCommit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=_here, capture_output=True,
+            text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, oldPath):
+    """
+    print how much slower or faster each benchmark got compared to a
+    results file saved earlier
+    """
+    with open(oldPath, 'r', encoding="utf-8") as f:
+        old = json.load(f)
+    key = lambda x: (x["benchmark"], x["count"], x["format"],
+                     x["documentSize"])
+    oldTimes = {key(x): x["seconds"] for x in old["results"]}
+    print(f"\ncompared to {old.get('commit')}:")
+    for result in results:
+        before = oldTimes.get(key(result))
+        if before:
+            print(f"  {'/'.join(str(x) for x in key(result))}: "
+                  f"{result['seconds'] / before:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="benchmark the parts toolbox on synthetic libraries")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000],
+                        help="numbers of documents in the libraries")
+    parser.add_argument("--formats", nargs="+", choices=fileFormats,
+                        default=list(fileFormats))
+    parser.add_argument("--document-sizes", nargs="+",
+                        choices=documentSizes, default=["mixed"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="save the results to this file")
+    parser.add_argument("--compare", metavar="OLD_RESULTS",
+                        help="compare with results saved earlier")
+    options = parser.parse_args()
+    app = qtApplication()
+    results = []
+
+    def add(times, count, fileFormat, documentSize):
+        for name, seconds in times.items():
+            print(f"{documentSize:>9} {fileFormat:>9} "
+                  f"{count:>6}  {name}: {seconds*1000:.1f} ms")
+            results.append({
+                "benchmark": name, "count": count, "format": fileFormat,
+                "documentSize": documentSize, "seconds": seconds})
+    add(benchSynthetic(options.repeat, app), 10000, "synthetic", "synthetic")
+    try:
+        for documentSize in options.document_sizes:
+            templates = loadTemplates(documentSize)
+            for fileFormat in options.formats:
+                for count in options.sizes:
+                    root = os.path.join(
+                        _work, f"library-{documentSize}-{fileFormat}-{count}")
+                    paths = generateLibrary(root, count, fileFormat,
+                                            documentSize, templates)
+                    times = benchLibrary(root, paths, options.repeat, app)
+                    shutil.rmtree(root)
+                    add(times, count, fileFormat, documentSize)
+    finally:
+        shutil.rmtree(_work, ignore_errors=True)
+    report = {
+        "commit": gitCommit(),
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "repeat": options.repeat,
+        "results": results,
+    }
+    if options.output:
+        with open(options.output, 'w', encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    if options.compare:
+        compare(results, options.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# a stand-in for the FreeCAD module, so that the benchmarks can import
+# the toolbox modules in a plain python interpreter. Only what the
+# toolbox uses outside of actual FreeCAD documents is provided.
+# Preferences live in memory, and user data goes to the folder named
+# by the PTB_BENCH_APPDATA environment variable (a temporary folder
+# by default)
+#
+
+import os
+import tempfile
+
+__stub__ = True
+
+
+class _ParameterGroup:
+    def __init__(self):
+        self.values = {}
+
+    def _get(self, key, default):
+        return self.values.get(key, default)
+
+    def GetBool(self, key, default=False):
+        return self._get(key, default)
+
+    def GetInt(self, key, default=0):
+        return self._get(key, default)
+
+    def GetFloat(self, key, default=0.0):
+        return self._get(key, default)
+
+    def GetString(self, key, default=""):
+        return self._get(key, default)
+
+    def _set(self, key, value):
+        self.values[key] = value
+
+    SetBool = SetInt = SetFloat = SetString = _set
+
+
+_parameters = {}
+
+
+def ParamGet(path):
+    return _parameters.setdefault(path, _ParameterGroup())
+
+
+class Console:
+    """
+    collects messages instead of printing them, so they don't end up
+    in the benchmark output. Set 'verbose' to see them
+    """
+    verbose = False
+    messages = []
+
+    @classmethod
+    def _print(cls, kind, text):
+        cls.messages.append((kind, text))
+        if cls.verbose:
+            print(kind, text, end="")
+
+    @classmethod
+    def PrintMessage(cls, text):
+        cls._print("Message", text)
+
+    @classmethod
+    def PrintWarning(cls, text):
+        cls._print("Warning", text)
+
+    @classmethod
+    def PrintError(cls, text):
+        cls._print("Error", text)
+
+    @classmethod
+    def PrintLog(cls, text):
+        cls._print("Log", text)
+
+
+_appData = os.environ.get("PTB_BENCH_APPDATA") or \
+    tempfile.mkdtemp(prefix="PartsToolboxBench")
+
+
+def getUserAppDataDir():
+    return _appData + os.sep
+
+
+ActiveDocument = None
+
+
+def listDocuments():
+    return {}
+
+
+class Gui:
+    @staticmethod
+    def getIcon(name):
+        from PySide import QtGui
+        return QtGui.QIcon()
+
+    @staticmethod
+    def getMainWindow():
+        return None
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# FreeCAD provides a 'PySide' module that maps to the Qt bindings it
+# was built with. Outside of FreeCAD, do the same with PySide2 or
+# PySide6. As in FreeCAD, QtGui also holds the QtWidgets classes
+#
+
+import sys
+import types
+
+try:
+    from PySide2 import QtCore, QtGui as _QtGui, QtWidgets, QtUiTools
+except ImportError:
+    from PySide6 import QtCore, QtGui as _QtGui, QtWidgets, QtUiTools
+
+QtGui = types.ModuleType("PySide.QtGui")
+for _module in (_QtGui, QtWidgets):
+    for _name in dir(_module):
+        if not _name.startswith("_"):
+            setattr(QtGui, _name, getattr(_module, _name))
+
+sys.modules["PySide.QtCore"] = QtCore
+sys.modules["PySide.QtGui"] = QtGui
+sys.modules["PySide.QtUiTools"] = QtUiTools
@@ -25,10 +25,12 @@
 # since we just want one GUI command, this file has
 # less than usual
 
+import time
+_startTime = time.perf_counter()
+
 import FreeCAD
 import os
 import PTb_Base
-import shutil
 
 # setup preferences page
 FreeCAD.Gui.addPreferencePage(os.path.join(
@@ -37,7 +39,7 @@ FreeCAD.Gui.addIconPath(PTb_Base.iconPath)
 # add the macros bundled with this module to the users macro directory
 UserMacroDir = FreeCAD.ParamGet(
     "User parameter:BaseApp/Preferences/Macro").GetString("MacroPath")
-Toolboxmacros = os.listdir(PTb_Base.MacroPath)
-for f in Toolboxmacros:
-    shutil.copy(os.path.join(PTb_Base.MacroPath, f), UserMacroDir)
-print("Loaded Parts Toolbox")
+for f in PTb_Base.installMacros(UserMacroDir):
+    FreeCAD.Console.PrintLog(f"PartsToolbox: installed macro {f}\n")
+print(f"Loaded Parts Toolbox "
+      f"({(time.perf_counter() - _startTime) * 1000:.1f} ms)")
@@ -0,0 +1,21 @@
+'''
+Pack a parts library folder into a single .ptbpack file.
+Put the pack in a library folder (like the user parts folder) to
+browse and insert its parts
+You can use this macro as a custom command to add a toolbar
+to FreeCAD
+'''
+
+import FreeCAD
+from PySide import QtGui
+from PTb_Pack import buildPack, packExtension
+
+mw = FreeCAD.Gui.getMainWindow()
+libraryRoot = QtGui.QFileDialog.getExistingDirectory(
+    mw, "Parts library folder to pack")
+if libraryRoot:
+    packPath, _ = QtGui.QFileDialog.getSaveFileName(
+        mw, "Save the pack as", libraryRoot + packExtension,
+        f"Parts library packs (*{packExtension})")
+    if packPath:
+        buildPack(libraryRoot, packPath)
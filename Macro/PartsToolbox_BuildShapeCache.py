@@ -0,0 +1,16 @@
+'''
+Precompute the shapes of all library parts in each of their sizes,
+so that parts can be inserted without rebuilding them. The cached
+shapes are used once 'Insert cached part shapes' is set in the
+PartsToolbox preferences
+You can use this macro as a custom command to add a toolbar
+to FreeCAD
+'''
+
+from PTb_Base import objpath, UserParams
+from PTb_ShapeCache import buildShapeCache
+
+buildShapeCache(objpath)
+userpath = UserParams.GetString("UserObjPath")
+if userpath:
+    buildShapeCache(userpath)
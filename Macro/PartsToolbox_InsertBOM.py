@@ -0,0 +1,21 @@
+'''
+Insert all parts listed in a bill of materials (csv file) into
+the active document, with a single recompute at the end.
+The csv file needs a 'Part' column, naming library parts. The
+optional columns Mode, Size, X, Y, Z, Yaw, Pitch, Roll and Count
+are described in PTb_FCFileTools.readPartsList
+You can use this macro as a custom command to add a toolbar
+to FreeCAD
+'''
+
+import FreeCAD
+from PySide import QtGui
+from PTb_FCFileTools import insertParts, readPartsList
+
+csvPath, _ = QtGui.QFileDialog.getOpenFileName(
+    FreeCAD.Gui.getMainWindow(), "Insert parts from a bill of materials",
+    "", "CSV files (*.csv)")
+if csvPath:
+    newObjects = insertParts(readPartsList(csvPath))
+    FreeCAD.Console.PrintMessage(
+        f"PartsToolbox: inserted {len(newObjects)} parts from {csvPath}\n")
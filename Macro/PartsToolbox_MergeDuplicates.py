@@ -0,0 +1,19 @@
+'''
+Merge the toolbox parts of the active document that show the same
+part in the same size into shared link arrays, so that each distinct
+part is only computed and displayed once
+You can use this macro as a custom command to add a toolbar
+to FreeCAD
+'''
+
+import FreeCAD
+from PTb_FCFileTools import mergeDuplicateParts
+
+doc = FreeCAD.ActiveDocument
+if doc is None:
+    FreeCAD.Console.PrintError(
+        "PartsToolbox Error: Active document not found!\n")
+else:
+    merged = mergeDuplicateParts(doc)
+    FreeCAD.Console.PrintMessage(
+        f"PartsToolbox: merged {merged} parts into link arrays\n")
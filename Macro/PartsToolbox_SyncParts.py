@@ -0,0 +1,17 @@
+'''
+Update the parts in the ToolboxParts folder of the active document
+from the parts library. Parts that were changed in the project are
+left alone
+You can use this macro as a custom command to add a toolbar
+to FreeCAD
+'''
+
+import FreeCAD
+from PTb_FCFileTools import syncToolboxParts, verifySavedDoc, NoOpenDocument
+
+try:
+    doc, pathToDoc = verifySavedDoc()
+    syncToolboxParts(pathToDoc)
+except NoOpenDocument:
+    FreeCAD.Console.PrintError(
+        "PartsToolbox Error: Active document not found or not saved to a file!\n")
@@ -29,9 +29,12 @@ Exports:
  - UIpath is the path to Qt UI xml files
  - iconPath is the path to icons included in this addon
  - UserParams holds FreeCAD user parameters related to the Parts Toolbox  
+ - installMacros copies the bundled macros to the users macro directory
 """
 
+import json
 import os
+import shutil
 import FreeCAD
 
 # relevant directories
@@ -43,3 +46,52 @@ iconPath = os.path.join(__dir__, "Icons")
 # import user preferences
 UserParams = FreeCAD.ParamGet(
     "User parameter:BaseApp/Preferences/Mod/PartsToolbox")
+
+# remembers which macros were installed, in the users macro directory
+macroStampName = ".PartsToolboxMacros.json"
+
+
+def installMacros(userMacroDir):
+    """
+    copy the macros bundled with this module to userMacroDir, but only
+    those that are missing there or differ from the bundled version.
+    The file sizes and modification times of both copies are kept in a
+    stamp file, so when nothing changed, startup only costs a few stat
+    calls and no files are written.
+    Returns the names of the macros that were copied
+    """
+    stampPath = os.path.join(userMacroDir, macroStampName)
+    try:
+        with open(stampPath, 'r', encoding="utf-8") as f:
+            stamps = json.load(f)
+    except (OSError, ValueError):
+        stamps = {}
+
+    def stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    newStamps = {}
+    copied = []
+    for name in sorted(os.listdir(MacroPath)):
+        source = os.path.join(MacroPath, name)
+        if not os.path.isfile(source):
+            continue
+        installed = os.path.join(userMacroDir, name)
+        newStamps[name] = [stat(source), stat(installed)]
+        if stamps.get(name) == newStamps[name]:
+            continue
+        if newStamps[name][1] is not None:
+            with open(source, 'rb') as a, open(installed, 'rb') as b:
+                if a.read() == b.read():
+                    continue
+        shutil.copy(source, installed)
+        newStamps[name][1] = stat(installed)
+        copied.append(name)
+    if newStamps != stamps:
+        with open(stampPath, 'w', encoding="utf-8") as f:
+            json.dump(newStamps, f)
+    return copied
@@ -25,23 +25,37 @@
 #
 
 import FreeCAD
+import csv
+import hashlib
+import html
+import json
 import os
+import re
 import shutil
+import tempfile
+from collections import OrderedDict
+from contextlib import contextmanager
 from zipfile import ZipFile
-import defusedxml.ElementTree as tree
-from PTb_Base import UserParams
+from PTb_Base import UserParams, objpath
+import PTb_Trace
 
 
-def getDependenciesRecursive(docObj):
+def getDependenciesRecursive(docObj, visited=None):
     """
-    recursively get dependencies of a given document object
+    recursively get dependencies of a given document object.
+    Each document is only visited once, so shared and circular
+    dependencies are fine
     """
-    dependencies = docObj.OutList[:]
+    if visited is None:
+        visited = set()
     full_list = []
-    for item in dependencies:
+    for item in docObj.OutList:
+        if item.FileName in visited:
+            continue
+        visited.add(item.FileName)
         full_list.append(item.FileName)
-        full_list.extend(getDependenciesRecursive(item))
-    return list(set(full_list))
+        full_list.extend(getDependenciesRecursive(item, visited))
+    return full_list
 
 
 def verifySavedDoc():
@@ -66,43 +80,528 @@ class NoOpenDocument(Exception):
     pass
 
 
-def copyFreeCADDocument(docFilePath, destinationDir):
+# ways of placing library files in a project, in the order they are
+# listed in the preferences (PlacementMode)
+placeCopy, placeHardlink, placeReflink, placeShared = range(4)
+# linux ioctl that shares the data blocks of two files (btrfs, xfs, ...)
+FICLONE = 0x40049409
+
+
+def getSharedStorePath():
+    """
+    folder of the content addressed store used by the 'shared store'
+    placement mode
+    """
+    return UserParams.GetString("SharedStorePath") or os.path.join(
+        FreeCAD.getUserAppDataDir(), "PartsToolbox", "Store")
+
+
+def hashFile(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def reflinkFile(src, dst):
+    """
+    make dst a copy-on-write clone of src. raises OSError where
+    the platform or file system can't do that
+    """
+    import fcntl  # not available on windows
+    with open(src, 'rb') as srcFile, open(dst, 'wb') as dstFile:
+        try:
+            fcntl.ioctl(dstFile.fileno(), FICLONE, srcFile.fileno())
+        except OSError:
+            dstFile.close()
+            os.remove(dst)
+            raise
+
+
+def addToSharedStore(src):
+    """
+    make sure the contents of file src are in the shared store,
+    and return the path of the stored file
+    """
+    digest = hashFile(src)
+    stored = os.path.join(getSharedStorePath(), digest[:2], digest)
+    if not os.path.exists(stored):
+        os.makedirs(os.path.dirname(stored), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(stored))
+        os.close(fd)
+        shutil.copyfile(src, tmpPath)
+        PTb_Trace.count("bytes copied", os.path.getsize(tmpPath))
+        # stored files are shared by every project using them, so
+        # nobody gets to change them in place
+        os.chmod(tmpPath, 0o444)
+        os.replace(tmpPath, stored)
+    return stored
+
+
+def placeFile(src, dst, mode):
+    """
+    put a copy of the file src at dst, using one of the place* modes.
+    Modes that aren't possible here fall back to a plain copy
+    """
+    PTb_Trace.count("files placed")
+    if mode == placeHardlink:
+        try:
+            os.link(src, dst)
+            return
+        except OSError:
+            pass
+    elif mode == placeReflink:
+        try:
+            reflinkFile(src, dst)
+            return
+        except (OSError, ImportError):
+            pass
+    elif mode == placeShared:
+        stored = addToSharedStore(src)
+        try:
+            os.link(stored, dst)
+            return
+        except OSError:
+            pass
+        try:
+            # the store is on another drive
+            os.symlink(stored, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy(src, dst)
+    PTb_Trace.count("bytes copied", os.path.getsize(dst))
+
+
+def documentMembers(docPath):
+    """
+    list the files making up a FreeCAD document, as (path relative to
+    the folder holding the document, full path) tuples.
+    handle both .FCStd and save-as-directory file formats
+    """
+    name = os.path.basename(docPath)
+    if not os.path.isdir(docPath):
+        # .FCStd format
+        return [(name, docPath)]
+    # directory format
+    members = []
+    for dirpath, dirnames, filenames in os.walk(docPath):
+        relDir = os.path.normpath(
+            os.path.join(name, os.path.relpath(dirpath, docPath)))
+        for f in filenames:
+            members.append((os.path.join(relDir, f), os.path.join(dirpath, f)))
+    return members
+
+
+def fileStamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class PartsManifest:
+    """
+    Record of the library files placed in a projects ToolboxParts folder.
+
+    For every placed file, the manifest remembers the library file it
+    came from, the stats of both files at the time, and a hash of the
+    contents. That way a library file that was fixed can be told apart
+    from a project file that was edited, and only files that actually
+    changed are placed again. It is saved as a json file in the
+    ToolboxParts folder
+    """
+    fileName = ".PartsToolboxManifest.json"
+    version = 1
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, self.fileName)
+        # document name -> library path of the document
+        self.documents = {}
+        # path relative to folder -> record
+        self.files = {}
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") == self.version:
+            self.documents = data["documents"]
+            self.files = data["files"]
+
+    def save(self):
+        data = {"version": self.version,
+                "documents": self.documents, "files": self.files}
+        os.makedirs(self.folder, exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding="utf-8") as f:
+            json.dump(data, f, indent=1)
+        os.replace(tmpPath, self.path)
+
+    def syncDocument(self, docPath, mode, force=False, source=None):
+        """
+        bring the project copy of the library document docPath up to
+        date, one file at a time. Files edited in the project are left
+        alone unless 'force' is set. 'source' is the library path to
+        remember for the document if it isn't docPath itself, like the
+        packed path of an unpacked document.
+        Returns a dict counting what happened to the files
+        """
+        name = os.path.basename(docPath)
+        self.documents[name] = source or docPath
+        counts = dict.fromkeys(
+            ("placed", "updated", "unchanged", "kept", "removed"), 0)
+        members = documentMembers(docPath)
+        for rel, src in members:
+            counts[self._syncFile(rel, src, mode, force)] += 1
+        # files that were removed from a directory document
+        current = {rel for rel, src in members}
+        for rel in [x for x in self.files if x not in current and
+                    x.startswith(name + os.sep)]:
+            dst = os.path.join(self.folder, rel)
+            if force or not self._locallyModified(rel, dst):
+                if os.path.lexists(dst):
+                    os.remove(dst)
+                del self.files[rel]
+                counts["removed"] += 1
+        return counts
+
+    def _locallyModified(self, rel, dst):
+        """
+        has the project file been changed since it was placed?
+        """
+        record = self.files.get(rel)
+        if not os.path.exists(dst):
+            return False
+        if record is None:
+            return True
+        if fileStamp(dst) == record["dstStamp"]:
+            return False
+        return hashFile(dst) != record["hash"]
+
+    def _syncFile(self, rel, src, mode, force):
+        dst = os.path.join(self.folder, rel)
+        record = self.files.get(rel)
+        srcStamp = fileStamp(src)
+        if os.path.islink(dst) and not os.path.exists(dst):
+            # a link into a shared store whose file is gone. place it again
+            os.remove(dst)
+        if not os.path.lexists(dst):
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            placeFile(src, dst, mode)
+            self._record(rel, src, dst, srcStamp, hashFile(src))
+            return "placed"
+        if record is not None and record["source"] == src \
+                and record["srcStamp"] == srcStamp \
+                and record["dstStamp"] == fileStamp(dst):
+            # the cheap check: nothing was touched on either side
+            return "unchanged"
+        if os.path.samefile(src, dst):
+            # a hard link to the library file. it is always current
+            self._record(rel, src, dst, srcStamp, hashFile(src))
+            return "unchanged"
+        srcHash = hashFile(src)
+        if self._locallyModified(rel, dst):
+            if record is None and hashFile(dst) == srcHash:
+                # placed before we kept a manifest. adopt it
+                self._record(rel, src, dst, srcStamp, srcHash)
+                return "unchanged"
+            if not force:
+                FreeCAD.Console.PrintWarning(
+                    f"PartsToolbox: not updating {dst}, it was changed "
+                    "in this project\n")
+                return "kept"
+        elif record is not None and srcHash == record["hash"]:
+            # touched, but the same contents
+            self._record(rel, src, dst, srcStamp, srcHash)
+            return "unchanged"
+        # replace the file in one step, so a failure can't leave
+        # half a file behind
+        tmpPath = dst + ".ptbtmp"
+        if os.path.lexists(tmpPath):
+            os.remove(tmpPath)
+        placeFile(src, tmpPath, mode)
+        os.replace(tmpPath, dst)
+        self._record(rel, src, dst, srcStamp, srcHash)
+        return "updated"
+
+    def _record(self, rel, src, dst, srcStamp, contentHash):
+        self.files[rel] = {
+            "source": src,
+            "srcStamp": srcStamp,
+            "dstStamp": fileStamp(dst),
+            "hash": contentHash,
+        }
+
+
+def copyFreeCADDocument(docFilePath, destinationDir, mode=None):
     """
     given a FreeCAD document saved to docFilePath, copy its file and
     any files it depends on to the directory destinationDir.
+    Files that are already there are only replaced if the library
+    file has changed since it was copied.
+    'mode' is one of the place* modes, by default the one
+    chosen in the preferences
     """
-    # open the document, get its dependencies, then close it
-    docObj = FreeCAD.openDocument(docFilePath, hidden=True)
-    files = [docObj.FileName] + getDependenciesRecursive(docObj)
-    FreeCAD.closeDocument(docObj.Name)
-    # DocumentObject.FileName gets us the full path to the files
-    # which is convenient
+    copyFreeCADDocuments([docFilePath], destinationDir, mode)
+
+
+def copyFreeCADDocuments(docFilePaths, destinationDir, mode=None):
+    """
+    same as copyFreeCADDocument, for a list of documents at once.
+    Documents shared by several of them are only looked at once
+    """
+    if mode is None:
+        mode = UserParams.GetInt("PlacementMode")
+    files = {}
+    # unpacked document -> its packed path, which is what the manifest
+    # remembers, so a newer pack is noticed when syncing
+    packedSources = {}
+    with PTb_Trace.stage("resolve dependencies"):
+        for docFilePath in docFilePaths:
+            packed = splitPackedPath(docFilePath)
+            if packed:
+                # packed documents are only unpacked when they are used
+                docFilePath = unpackDocument(docFilePath)
+            docFilePath = os.path.normpath(os.path.abspath(docFilePath))
+            files[docFilePath] = None
+            dependencies = getDocumentDependencies(docFilePath)
+            files.update(dict.fromkeys(dependencies))
+            if packed:
+                # linked documents of the same pack are unpacked next to it
+                unpackedFolder = os.path.dirname(docFilePath)
+                for f in [docFilePath] + list(dependencies):
+                    if os.path.dirname(f) == unpackedFolder:
+                        packedSources[f] = os.path.join(
+                            packed[0], os.path.basename(f))
+    manifest = PartsManifest(destinationDir)
     for f in files:
-        # copy each file. handle both .FCStd and save-as-directory
-        # file formats
-        if not os.path.exists(os.path.join(destinationDir, os.path.basename(f))):
-            # don't copy files that already exist
-            if f.endswith(".FCStd"):
-                # .FCStd format
-                shutil.copy(f, destinationDir)
-            else:
-                # directory format
-                shutil.copytree(f, os.path.join(
-                    destinationDir, os.path.basename(f)))
+        with PTb_Trace.stage("sync document", document=f):
+            manifest.syncDocument(f, mode, source=packedSources.get(f))
+    manifest.save()
     return
 
 
-def getDataFromFCFile(docPath):
+def findLibraryDocument(name):
     """
-    given a FreeCAD document file, return metadata
-    of a parts library object stored there.
-    Handles directory and .FCStd formats
+    look for a document called 'name' in the parts libraries
+    """
+    for folder in (objpath, UserParams.GetString("UserObjPath")):
+        if folder and os.path.exists(os.path.join(folder, name)):
+            return os.path.join(folder, name)
+    return None
+
+
+def syncToolboxParts(projectDir, mode=None, force=False):
+    """
+    update every library document in the ToolboxParts folder next to
+    a project from the library it came from. Documents copied before
+    the folder had a manifest are matched up with the library by name.
+    Files changed in the project are only overwritten if 'force' is set
+    """
+    if mode is None:
+        mode = UserParams.GetInt("PlacementMode")
+    folder = os.path.join(projectDir, "ToolboxParts")
+    if not os.path.isdir(folder):
+        return
+    manifest = PartsManifest(folder)
+    for name in os.listdir(folder):
+        if name not in manifest.documents and \
+                (name.endswith(".FCStd") or
+                 os.path.isfile(os.path.join(folder, name, "Document.xml"))):
+            source = findLibraryDocument(name)
+            if source:
+                manifest.documents[name] = source
+    totals = {}
+    for name, source in sorted(manifest.documents.items()):
+        docPath = source
+        try:
+            if splitPackedPath(source):
+                # unpacks the current version of the pack
+                docPath = unpackDocument(source)
+        except KeyError:
+            # no longer in the pack
+            docPath = None
+        if docPath is None or not os.path.exists(docPath):
+            FreeCAD.Console.PrintWarning(
+                f"PartsToolbox: {source} is gone from the library, "
+                f"keeping the project copy of {name}\n")
+            continue
+        counts = manifest.syncDocument(docPath, mode, force, source=source)
+        for key, count in counts.items():
+            totals[key] = totals.get(key, 0) + count
+    manifest.save()
+    FreeCAD.Console.PrintMessage(
+        "PartsToolbox: synced ToolboxParts: " +
+        ", ".join(f"{count} {key}" for key, count in totals.items()) + "\n")
+    return totals
+
+
+# names of the Part object properties that make up a library parts metadata
+metadataFields = ("Id", "Type", "License", "LicenseURL")
+
+
+@contextmanager
+def openDocumentXml(docPath):
+    """
+    open the Document.xml file of a FreeCAD document for reading.
+    Handles directory and .FCStd formats. zipped documents are
+    decompressed as they are read, not all at once
     """
     if os.path.isdir(docPath):  # save-as-folder mode
-        doc = tree.parse(open(os.path.join(docPath, "Document.xml")))
+        with open(os.path.join(docPath, "Document.xml"), 'rb') as docFile:
+            yield docFile
     else:  # .FCStd file mode
         with ZipFile(docPath, 'r') as zippedFCStd:
-            doc = tree.parse(zippedFCStd.open('Document.xml', 'r'))
+            with zippedFCStd.open('Document.xml', 'r') as docFile:
+                yield docFile
+
+
+# file name extension of parts libraries packed into one file
+packExtension = ".ptbpack"
+_packedPathPattern = re.compile(r"^(.*?\.ptbpack)[\\/]([^\\/]+)$")
+
+
+def unpackDocument(docPath):
+    """
+    unpack the packed document docPath and return the path of the copy
+    """
+    # imported here, PTb_Pack needs this module
+    from PTb_Pack import extractDocument
+    return extractDocument(docPath)
+
+
+def splitPackedPath(path):
+    """
+    documents in a packed library (see PTb_Pack) have paths like
+    'folder/library.ptbpack/document'. Return the path of the pack and
+    the name of the document for such paths, or None for other paths
+    """
+    match = _packedPathPattern.match(path)
+    if match and os.path.isfile(match.group(1)):
+        return match.group(1), match.group(2)
+    return None
+
+
+def getDocumentStamp(docPath):
+    """
+    return a (modification time, size) pair that changes whenever
+    the document is saved. For save-as-directory documents this is
+    taken from the Document.xml file, for packed documents from the
+    pack file
+    """
+    packed = splitPackedPath(docPath)
+    if packed:
+        st = os.stat(packed[0])
+    elif os.path.isdir(docPath):
+        st = os.stat(os.path.join(docPath, "Document.xml"))
+    else:
+        st = os.stat(docPath)
+    return (st.st_mtime_ns, st.st_size)
+
+
+# the file attribute of the XLink elements that store the targets of
+# App::Link and other link properties
+_xlinkFilePattern = re.compile(rb'<XLink\s+file="([^"]+)"')
+# document path -> (stamp, [linked document paths])
+_linkCache = {}
+
+
+def resolveLinkPath(docPath, fileName):
+    """
+    find the document a link in docPath to 'fileName' refers to.
+    Links are stored relative to the folder holding the document.
+    A link to a .FCStd file is also satisfied by a save-as-directory
+    document of the same name, and the other way round.
+    Returns None if there is no such document
+    """
+    target = os.path.normpath(
+        os.path.join(os.path.dirname(docPath), fileName))
+    stem = target.removesuffix(".FCStd")
+    for candidate in (target, stem + ".FCStd", stem):
+        if os.path.isfile(os.path.join(candidate, "Document.xml")) or \
+                (candidate.endswith(".FCStd") and os.path.isfile(candidate)):
+            return candidate
+    return None
+
+
+def getLinkedFileNames(xmlData):
+    """
+    return the file names of the external documents linked to in the
+    contents of a Document.xml file, each name once
+    """
+    return [html.unescape(x.decode("utf-8"))
+            for x in dict.fromkeys(_xlinkFilePattern.findall(xmlData))]
+
+
+def getDocumentLinks(docPath):
+    """
+    return the paths of the documents that docPath links to directly,
+    read from its Document.xml without loading it in FreeCAD.
+    Results are kept until the document changes
+    """
+    stamp = getDocumentStamp(docPath)
+    cached = _linkCache.get(docPath)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    with openDocumentXml(docPath) as docFile:
+        fileNames = getLinkedFileNames(docFile.read())
+    links = []
+    for fileName in fileNames:
+        target = resolveLinkPath(docPath, fileName)
+        if target is None:
+            FreeCAD.Console.PrintWarning(
+                f"PartsToolbox: {docPath} links to {fileName}, "
+                "which could not be found\n")
+        elif target != docPath:
+            links.append(target)
+    _linkCache[docPath] = (stamp, links)
+    return links
+
+
+def getDocumentDependencies(docPath):
+    """
+    return the paths of all documents that docPath depends on,
+    directly or through other documents, in the order they were
+    found. Every document is read at most once, and circular links
+    are reported instead of followed around
+    """
+    docPath = os.path.normpath(os.path.abspath(docPath))
+    found = {docPath: None}
+    # depth first, with the documents on the current path in 'stack'
+    stack = [(docPath, iter(getDocumentLinks(docPath)))]
+    onStack = {docPath}
+    while stack:
+        current, links = stack[-1]
+        target = next(links, None)
+        if target is None:
+            stack.pop()
+            onStack.discard(current)
+        elif target in onStack:
+            FreeCAD.Console.PrintLog(
+                f"PartsToolbox: circular link from {current} "
+                f"to {target}\n")
+        elif target not in found:
+            found[target] = None
+            stack.append((target, iter(getDocumentLinks(target))))
+            onStack.add(target)
+    return list(found)[1:]
+
+
+def getDataFromFCFile(docPath, streaming=True):
+    """
+    given a FreeCAD document file, return metadata
+    of a parts library object stored there.
+    Handles directory and .FCStd formats.
+    By default the document is read with a streaming parser that
+    stops as soon as the metadata has been found. Pass
+    streaming=False to parse the complete document instead
+    """
+    with openDocumentXml(docPath) as docFile:
+        if streaming:
+            return readPartMetadata(docFile, docPath)
+        import defusedxml.ElementTree as tree
+        doc = tree.parse(docFile)
     root = doc.getroot()
     # we have the xml data, let's get something useful out of it
     docObjects = list(root.iter(tag="ObjectData"))[0]
@@ -115,18 +614,182 @@ def getDataFromFCFile(docPath):
         proplist = list(partObj.iter(tag="Properties"))[0]
     else:
         raise ValueError(f"Document {docPath} has no object named Part")
-    metadata = {
-        "Id": "",
-        "Type": "",
-        "License": "",
-        "LicenseURL": "",
-    }
+    metadata = dict.fromkeys(metadataFields, "")
     for prop in proplist:
         if prop.attrib["name"] in metadata.keys():
             metadata[prop.attrib["name"]] = prop[0].attrib["value"]
     return(metadata)
 
 
+def readPartMetadata(docFile, docPath):
+    """
+    pull the metadata of the Part object out of an open Document.xml
+    file (or a file object holding its contents) of the document
+    docPath, one element at a time. Elements are detached from the tree
+    as soon as they are closed, so only the path from the document
+    root to the current element (plus the property being read) is
+    ever held in memory.
+    The expected layout is:
+    Document/ObjectData/Object[@name='Part']/Properties/Property/String
+    """
+    # imported on first use, it isn't needed to start the workbench
+    import defusedxml.ElementTree as tree
+    metadata = dict.fromkeys(metadataFields, "")
+    remaining = set(metadataFields)
+    stack = []
+    inPart = False
+    for event, elem in tree.iterparse(docFile, events=("start", "end")):
+        if event == "start":
+            stack.append(elem)
+            if (len(stack) == 3 and elem.tag == "Object"
+                    and stack[1].tag == "ObjectData"
+                    and elem.get("name") == "Part"):
+                inPart = True
+            continue
+        stack.pop()
+        depth = len(stack) + 1
+        if inPart:
+            if depth == 5 and elem.tag == "Property" \
+                    and elem.get("name") in remaining and len(elem):
+                metadata[elem.get("name")] = elem[0].get("value", "")
+                remaining.discard(elem.get("name"))
+                if not remaining:
+                    return metadata
+            elif depth == 3:
+                # reached the end of the Part object
+                return metadata
+        elif depth == 2 and elem.tag == "ObjectData":
+            break
+        if depth <= 5 and stack:
+            # throw away everything we are done with. children of
+            # property elements go along with their parent
+            stack[-1].remove(elem)
+    raise ValueError(f"Document {docPath} has no object named Part")
+
+
+def encodeAttribute(value):
+    """
+    escape a string for use as an xml attribute value, the same way
+    FreeCAD does
+    """
+    for char, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;"),
+                         ('"', "&quot;"), ("'", "&apos;"),
+                         ("\n", "&#10;"), ("\r", "&#13;"), ("\t", "&#9;")):
+        value = value.replace(char, entity)
+    return value
+
+
+def patchMetadataXml(xmlData, metadata):
+    """
+    return a copy of the contents of a Document.xml file, with the
+    string properties of its Part object named in the dict 'metadata'
+    set to new values. Nothing else in the file is touched.
+    Raises ValueError if the Part object or one of the properties
+    can't be found
+    """
+    objectData = xmlData.find(b"<ObjectData")
+    start = xmlData.find(b'<Object name="Part"', objectData)
+    if objectData < 0 or start < 0:
+        raise ValueError("document has no object named Part")
+    end = xmlData.find(b"</Object>", start)
+    if end < 0:
+        raise ValueError("the Part object is cut short")
+    part = xmlData[start:end]
+    for key, value in metadata.items():
+        pattern = re.compile(
+            rb'(<Property name="' + re.escape(key.encode()) +
+            rb'" type="App::PropertyString"[^>]*>\s*<String value=")'
+            rb'[^"]*(")')
+        value = encodeAttribute(value).encode("utf-8")
+        part, count = pattern.subn(
+            lambda m: m.group(1) + value + m.group(2), part, count=1)
+        if count == 0:
+            raise ValueError(f"Part object has no property {key}")
+    return xmlData[:start] + part + xmlData[end:]
+
+
+def patchDocumentMetadata(docPath, metadata):
+    """
+    set metadata properties of the Part object of a saved document,
+    by rewriting its Document.xml, without loading it in FreeCAD.
+    For .FCStd files the zip archive is rebuilt around the new
+    Document.xml. The new file replaces the old one in a single step,
+    and is checked by reading the metadata back
+    """
+    docPath = os.path.normpath(docPath)
+    if os.path.isdir(docPath):
+        target = os.path.join(docPath, "Document.xml")
+        with open(target, 'rb') as f:
+            xmlData = patchMetadataXml(f.read(), metadata)
+    else:
+        target = docPath
+    fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(target),
+                                   suffix=".tmp")
+    try:
+        if target != docPath:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(xmlData)
+        else:
+            os.close(fd)
+            with ZipFile(docPath, 'r') as oldZip, \
+                    ZipFile(tmpPath, 'w') as newZip:
+                for info in oldZip.infolist():
+                    data = oldZip.read(info)
+                    if info.filename == "Document.xml":
+                        data = patchMetadataXml(data, metadata)
+                    newZip.writestr(info, data)
+        shutil.copymode(target, tmpPath)
+        os.replace(tmpPath, target)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+    written = getDataFromFCFile(docPath)
+    if any(written[key] != value for key, value in metadata.items()):
+        raise ValueError("metadata did not read back as written")
+
+
+def _patchDocumentItem(item):
+    patchDocumentMetadata(*item)
+
+
+def roundTripMetadata(docPath, metadata):
+    """
+    set metadata properties of the Part object of a saved document by
+    opening it in FreeCAD, then recomputing and saving it
+    """
+    doc = FreeCAD.openDocument(docPath, hidden=True)
+    for key, val in metadata.items():
+        setattr(doc.Part, key, val)
+    doc.recompute()
+    doc.save()
+    FreeCAD.closeDocument(doc.Name)
+
+
+def writeMetadata(changes, workers=None):
+    """
+    save new metadata for many documents. 'changes' is a dict of
+    document path -> {property name: value}.
+    Documents are patched directly, in parallel, unless that is turned
+    off in the preferences (PatchMetadataInPlace). Documents that
+    can't be patched are saved through FreeCAD instead
+    """
+    # imported here, PTb_Library depends on this module
+    from PTb_Library import runParallel
+    changes = dict(changes)
+    if UserParams.GetBool("PatchMetadataInPlace", True):
+        results = runParallel(_patchDocumentItem, changes.items(), workers)
+        for (docPath, metadata), result, error in results:
+            if error:
+                FreeCAD.Console.PrintWarning(
+                    f"PartsToolbox: could not patch {docPath} ({error}), "
+                    "saving it through FreeCAD instead\n")
+            else:
+                del changes[docPath]
+    for docPath, metadata in changes.items():
+        roundTripMetadata(docPath, metadata)
+
+
 def getFCFiles(folder):
     """
     get all FreeCAD documents stored in 'folder'. finds files saved 
@@ -143,37 +806,167 @@ def getFCFiles(folder):
     return freecadfiles
 
 
+class DocumentCache:
+    """
+    Library documents that were opened (hidden) to insert parts from,
+    kept open so that inserting the same part again doesn't load it
+    again.
+
+    At most DocumentCacheSize documents are kept, closing the least
+    recently used first. Documents that an open project links to are
+    never closed, and documents that were already open before the
+    cache opened them are never touched. A document whose file has
+    changed since it was opened is opened again
+    """
+
+    def __init__(self):
+        # file path -> (document name, file stamp), oldest first
+        self.documents = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # documents that mustn't be closed before hold() ends
+        self.held = set()
+        self.holding = 0
+        # hits and misses when the outermost hold() began
+        self.heldCounts = (0, 0)
+
+    @contextmanager
+    def hold(self):
+        """
+        keep every document opened in the block open until it ends,
+        however many there are. Documents past the capacity are closed
+        afterwards, and the hits and misses of the block are reported
+        """
+        if not self.holding:
+            self.heldCounts = (self.hits, self.misses)
+        self.holding += 1
+        try:
+            yield
+        finally:
+            self.holding -= 1
+            if not self.holding:
+                self.held.clear()
+                self._evict()
+                self._report(*self.heldCounts)
+
+    def capacity(self):
+        return max(1, UserParams.GetInt("DocumentCacheSize", 8))
+
+    def openDocument(self, docPath):
+        """
+        return the FreeCAD document saved at docPath, opening it
+        hidden if it isn't open yet
+        """
+        counts = (self.hits, self.misses)
+        doc = self._openDocument(docPath)
+        # lookups in a hold() block are reported together when it ends
+        if not self.holding:
+            self._report(*counts)
+        return doc
+
+    def _openDocument(self, docPath):
+        docPath = os.path.normpath(os.path.abspath(docPath))
+        if self.holding:
+            self.held.add(docPath)
+        stamp = getDocumentStamp(docPath)
+        openDocs = FreeCAD.listDocuments()
+        entry = self.documents.pop(docPath, None)
+        if entry:
+            docName, oldStamp = entry
+            doc = openDocs.get(docName)
+            if doc and (oldStamp == stamp or
+                        docName in self._linkedDocuments()):
+                # a changed document that a project still links to
+                # can't be reopened. FreeCAD would hand it back anyway
+                self.hits += 1
+                self.documents[docPath] = entry
+                return doc
+            if doc:
+                FreeCAD.closeDocument(docName)
+        self.misses += 1
+        for doc in openDocs.values():
+            if os.path.normpath(doc.FileName) == docPath:
+                # opened by the user, not ours to close
+                return doc
+        doc = FreeCAD.openDocument(docPath, hidden=True)
+        self.documents[docPath] = (doc.Name, stamp)
+        self._evict(keep=docPath)
+        return doc
+
+    def _linkedDocuments(self):
+        """
+        names of the documents that open projects (any document not
+        in the cache) depend on
+        """
+        ours = {name for name, stamp in self.documents.values()}
+        linked = set()
+        for doc in FreeCAD.listDocuments().values():
+            if doc.Name not in ours:
+                linked.update(x.Name for x in doc.getDependentDocuments(False))
+        return linked
+
+    def _evict(self, keep=None):
+        """
+        close the least recently used documents past the capacity.
+        'keep' is the document about to be handed out, never closed
+        """
+        excess = len(self.documents) - self.capacity()
+        if excess <= 0:
+            return
+        openDocs = FreeCAD.listDocuments()
+        linked = self._linkedDocuments()
+        for docPath, (docName, stamp) in list(self.documents.items()):
+            if excess <= 0:
+                break
+            if docName in linked or docPath == keep or \
+                    docPath in self.held:
+                continue
+            if docName in openDocs:
+                FreeCAD.closeDocument(docName)
+            del self.documents[docPath]
+            excess -= 1
+
+    def _report(self, hits, misses):
+        """
+        print the hits and misses since there were 'hits' hits and
+        'misses' misses to the Report view
+        """
+        FreeCAD.Console.PrintMessage(
+            f"PartsToolbox: document cache: {self.hits - hits} hits, "
+            f"{self.misses - misses} misses ({self.hits} hits, "
+            f"{self.misses} misses this session), "
+            f"{len(self.documents)} open\n")
+
+
+documentCache = DocumentCache()
+
+
 def InsertParamObj(sourcePartPath, importMode):
     """
     Given a part filename, add a copy of that part to the 
     active FreeCAD document
     """
-    try:
-        doc, pathToDoc = verifySavedDoc()
-    except NoOpenDocument:
-        FreeCAD.Console.PrintError(
-            "PartsToolbox Error: Active document not found or not saved to a file!\n")
-        return
-    partFileName = os.path.basename(sourcePartPath)
-    partFilePath = os.path.join(
-        pathToDoc, "ToolboxParts", partFileName)
-    # place a "ToolboxParts" directory next to the open document:
-    os.makedirs(os.path.dirname(partFilePath), exist_ok=True)
-    # copy the parts document to the users project folder if it
-    # isn't already there:
-    copyFreeCADDocument(sourcePartPath, os.path.join(
-        pathToDoc, "ToolboxParts"))
-    # open the local copy of the part file so we can get an obj from it
-    part_doc = FreeCAD.openDocument(partFilePath, hidden=True)
-    # grab either a part or a body to link to:
-    if hasattr(part_doc, "Part"):
-        top_obj = part_doc.Part
-    elif hasattr(part_doc, "Body"):
-        top_obj = part_doc.Body
-    else:
-        FreeCAD.Console.PrintError(
-            f"PartsToolbox Error: file {partFileName} has no suitable objects to copy!\n")
-        return
+    insertParts([(sourcePartPath, importMode, None, None)])
+
+
+def getPartObject(partDoc):
+    """
+    the object to insert from a part document: either a part or a body
+    """
+    if hasattr(partDoc, "Part"):
+        return partDoc.Part
+    if hasattr(partDoc, "Body"):
+        return partDoc.Body
+    return None
+
+
+def addPartObject(doc, top_obj, importMode):
+    """
+    add one instance of top_obj to the document doc, in the way given
+    by importMode (0: shapebinder, 1: link, 2: copy). Link arrays
+    (mode 3) are made by addLinkArrayElement.
+    Returns the new object
+    """
     if importMode == 0:  # shapeBinder mode
         # add a shapebinder and assign an object to link
         binder = doc.addObject('PartDesign::SubShapeBinder', 'ToolboxPart')
@@ -181,12 +974,16 @@ def InsertParamObj(sourcePartPath, importMode):
         # modify the shapebinders properties so it behaves correctly
         binder.BindCopyOnChange = 'Enabled'
         # binder renders transparent w. yellow lines if this is True.
-        binder.ViewObject.UseBinderStyle = UserParams.GetBool("UseBinderStyle")
+        # there is no view object without the GUI, like under FreeCADCmd
+        if FreeCAD.GuiUp:
+            binder.ViewObject.UseBinderStyle = \
+                UserParams.GetBool("UseBinderStyle")
         # set label to mirror source objects label
         # getExpression returns a tuple (propname, extressionStr)
         objLabel = top_obj.getExpression("Label")
         if objLabel:
             binder.setExpression("Label", objLabel[1])
+        return binder
     elif importMode == 1:  # regular App::Link mode
         link = doc.addObject('App::Link')
         link.LinkedObject = top_obj
@@ -194,17 +991,450 @@ def InsertParamObj(sourcePartPath, importMode):
         objLabel = top_obj.getExpression("Label")
         if objLabel:
             link.setExpression("Label", objLabel[1])
+        return link
     elif importMode == 2:  # simple copy mode
-        objlist = [top_obj] + top_obj.OutListRecursive
-        FreeCAD.Gui.Selection.clearSelection()
-        for x in objlist:
-            FreeCAD.Gui.Selection.addSelection(x)
-        FreeCAD.Gui.runCommand("Std_Copy")
-        FreeCAD.Gui.Selection.clearSelection()
+        # copy the object along with everything it depends on straight
+        # into doc. Unlike copy & paste this leaves the clipboard and
+        # selection alone, and works without the GUI
+        return doc.copyObject(top_obj, True)
+    return None
+
+
+def sameObject(a, b):
+    """
+    whether a and b are the same object of the same saved document
+    """
+    return a is not None and b is not None and a.Name == b.Name and \
+        os.path.normpath(a.Document.FileName) == \
+        os.path.normpath(b.Document.FileName)
+
+
+def newLinkArray(doc, top_obj, name="ToolboxArray"):
+    """
+    add an empty link array of top_obj to doc. Its elements only exist
+    as placements, so they share the geometry and tessellation of a
+    single link
+    """
+    link = doc.addObject('App::Link', name)
+    link.LinkedObject = top_obj
+    link.LinkCopyOnChange = 'Enabled'
+    link.ShowElement = False
+    objLabel = top_obj.getExpression("Label")
+    if objLabel:
+        link.setExpression("Label", objLabel[1])
+    return link
+
+
+def appendLinkElements(link, placements):
+    placements = list(link.PlacementList) + list(placements)
+    link.ElementCount = len(placements)
+    link.PlacementList = placements
+
+
+def instanceConfiguration(obj, source):
+    """
+    the size of an instance obj of the part object source, as a tuple
+    of (property, value) pairs over the configuration properties of
+    source. None if obj doesn't have all of them, so its size can't
+    be told
+    """
+    configuration = []
+    for prop in configurationProperties(source):
+        if prop not in obj.PropertiesList:
+            return None
+        configuration.append((prop, getattr(obj, prop)))
+    return tuple(configuration)
+
+
+def sizeConfiguration(top_obj, size):
+    """
+    the configuration (see instanceConfiguration) top_obj takes when
+    it is inserted in 'size' (see setPartSize)
+    """
+    props = configurationProperties(top_obj)
+    configuration = {x: getattr(top_obj, x) for x in props}
+    for setting in (size or "").split(";"):
+        setting = setting.strip()
+        if not setting:
+            continue
+        if "=" in setting:
+            prop, value = (x.strip() for x in setting.split("=", 1))
+        else:
+            value = setting
+            prop = next((x for x in props if value in
+                         top_obj.getEnumerationsOfProperty(x)), None)
+        if prop in configuration:
+            configuration[prop] = value
+    return tuple((x, configuration[x]) for x in props)
+
+
+def linkSource(link):
+    """
+    the part object a link shows. Once a size property of a link is
+    changed, FreeCAD copies the linked object into the document of the
+    link (LinkCopyOnChange), and the original is only remembered as
+    LinkCopyOnChangeSource
+    """
+    return getattr(link, "LinkCopyOnChangeSource", None) or \
+        link.LinkedObject
+
+
+def sameGroup(obj, parent):
+    group = obj.getParentGroup()
+    if group is None or parent is None:
+        return group is None and parent is None
+    return group.Name == parent.Name
+
+
+def findLinkArray(doc, top_obj, configuration, parent=None):
+    """
+    the link array in doc, directly in the group 'parent' (None for
+    the top level), that holds top_obj in the given configuration.
+    None if there isn't one yet
+    """
+    for obj in doc.Objects:
+        if obj.TypeId == "App::Link" and obj.ElementCount > 0 and \
+                sameObject(linkSource(obj), top_obj) and \
+                sameGroup(obj, parent) and \
+                instanceConfiguration(obj, top_obj) == configuration:
+            return obj
+    return None
+
+
+def addLinkArrayElement(doc, top_obj, size, placement, arrays=None):
+    """
+    add one instance of top_obj to the top level of doc as an element
+    of a shared link array, made the first time top_obj is inserted in
+    that size. 'arrays' remembers the arrays of earlier calls, since
+    a new array may not show its size properties before a recompute.
+    Returns the array
+    """
+    if arrays is None:
+        arrays = {}
+    configuration = sizeConfiguration(top_obj, size)
+    key = (top_obj.Document.FileName, top_obj.Name, configuration)
+    link = arrays.get(key) or findLinkArray(doc, top_obj, configuration)
+    if link is None:
+        link = newLinkArray(doc, top_obj)
+        if size:
+            setPartSize(link, size)
+    arrays[key] = link
+    appendLinkElements(link, [placement or FreeCAD.Placement()])
+    return link
+
+
+def toolboxSource(obj):
+    """
+    the object of a ToolboxParts document that the binder or link obj
+    was inserted from, or None
+    """
+    if obj.TypeId == "PartDesign::SubShapeBinder":
+        support = obj.Support
+        source = support[0][0] if support else None
+    elif obj.TypeId == "App::Link":
+        source = linkSource(obj)
+    else:
+        return None
+    if source is None or os.path.basename(os.path.dirname(
+            source.Document.FileName)) != "ToolboxParts":
+        return None
+    return source
+
+
+def mergeDuplicateParts(doc):
+    """
+    replace toolbox binders and links in doc that show the same part in
+    the same size, in the same group, by one link array per part, size
+    and group. Existing arrays are added to. Binders and links that
+    other objects depend on (like binders in a Body), and those that
+    don't show all the size properties of their part, are left alone.
+    Returns the number of objects merged
+    """
+    groups = OrderedDict()
+    for obj in doc.Objects:
+        source = toolboxSource(obj)
+        if source is None:
+            continue
+        parent = obj.getParentGroup()
+        if any(parent is None or x.Name != parent.Name
+               for x in obj.InList) or \
+                (parent is not None and parent.TypeId == "PartDesign::Body"):
+            continue
+        configuration = instanceConfiguration(obj, source)
+        if configuration is None:
+            # can't tell which size it is
+            continue
+        key = (source.Document.FileName, source.Name, configuration,
+               parent.Name if parent else None)
+        groups.setdefault(key, [source, parent, configuration, None, []])
+        if obj.TypeId == "App::Link" and obj.ElementCount > 0:
+            if groups[key][3] is None:
+                groups[key][3] = obj
+            continue
+        groups[key][4].append(obj)
+    merged = 0
+    doc.openTransaction("Merge toolbox parts")
+    try:
+        for source, parent, configuration, link, duplicates in \
+                groups.values():
+            if len(duplicates) + (link is not None) < 2:
+                continue
+            if link is None:
+                link = newLinkArray(doc, source)
+                for prop, value in configuration:
+                    setattr(link, prop, value)
+                if parent is not None:
+                    parent.addObject(link)
+            appendLinkElements(link, [x.Placement for x in duplicates])
+            for obj in duplicates:
+                doc.removeObject(obj.Name)
+            merged += len(duplicates)
+    except Exception:
+        doc.abortTransaction()
+        raise
+    doc.commitTransaction()
+    if merged:
+        doc.recompute()
+    return merged
+
+
+def configurationProperties(obj):
+    """
+    the size properties of a part object: enumerations that copy the
+    part when they are changed (as those of configuration tables do)
+    """
+    return [x for x in obj.PropertiesList
+            if obj.getTypeIdOfProperty(x) == "App::PropertyEnumeration"
+            and "CopyOnChange" in obj.getPropertyStatus(x)]
+
+
+def setPartSize(obj, size):
+    """
+    choose the size of an inserted part. 'size' is either a list of
+    'Property=Value' settings separated by ';', or just a value, which
+    goes to the first enumeration property that has it
+    (a Diameter of 'M5', say)
+    """
+    for setting in size.split(";"):
+        setting = setting.strip()
+        if not setting:
+            continue
+        if "=" in setting:
+            prop, value = (x.strip() for x in setting.split("=", 1))
+        else:
+            value = setting
+            prop = next((x for x in obj.PropertiesList
+                         if obj.getTypeIdOfProperty(x) ==
+                         "App::PropertyEnumeration" and
+                         value in obj.getEnumerationsOfProperty(x)), None)
+            if prop is None:
+                FreeCAD.Console.PrintWarning(
+                    f"PartsToolbox: {obj.Label} has no size {value}\n")
+                continue
+        setattr(obj, prop, value)
+
+
+def insertParts(entries):
+    """
+    add many parts to the active FreeCAD document in one go.
+    'entries' is a list of (part file name, import mode, placement,
+    size) tuples, where placement (a FreeCAD.Placement) and size
+    (see setPartSize) may be None.
+    Every library document is copied and opened only once, however
+    many times it is inserted. All objects are added in a single undo
+    transaction, and only the new objects are recomputed.
+    With the UseShapeCache preference, binders and links are replaced
+    by plain copies of the precomputed shape of the part where one is
+    cached (see PTb_ShapeCache), and the document isn't opened at all.
+    Returns the new objects, along with the link arrays (import mode 3)
+    that were added to
+    """
+    try:
+        doc, pathToDoc = verifySavedDoc()
+    except NoOpenDocument:
+        FreeCAD.Console.PrintError(
+            "PartsToolbox Error: Active document not found or not saved to a file!\n")
+        return []
+    if not entries:
+        return []
+    with PTb_Trace.session("insert parts"):
+        partsDir = os.path.join(pathToDoc, "ToolboxParts")
+        cachedShapes = {}
+        if UserParams.GetBool("UseShapeCache"):
+            # imported here, PTb_ShapeCache needs this module
+            from PTb_ShapeCache import findCachedShape, addCachedShape
+            simplified = UserParams.GetBool("SimplifiedThreads")
+            with PTb_Trace.stage("find cached shapes"):
+                for number, (sourcePartPath, importMode, placement,
+                             size) in enumerate(entries):
+                    if importMode in (0, 1):
+                        found = findCachedShape(sourcePartPath, size,
+                                                simplified)
+                        if found:
+                            cachedShapes[number] = found
+        # copy the parts documents to the users project folder if they
+        # aren't already there:
+        sources = list(dict.fromkeys(
+            x[0] for number, x in enumerate(entries)
+            if number not in cachedShapes))
+        if sources:
+            # place a "ToolboxParts" directory next to the open document
+            os.makedirs(partsDir, exist_ok=True)
+            with PTb_Trace.stage("copy", parts=len(sources)):
+                copyFreeCADDocuments(sources, partsDir)
+        # the documents of this batch are held open until the objects
+        # made from them are in: nothing links to them before that, so
+        # the cache would be free to close them
+        with documentCache.hold():
+            # open the local copies of the part files so we can get objs
+            # from them
+            topObjects = {}
+            for sourcePartPath in sources:
+                partFileName = os.path.basename(sourcePartPath)
+                with PTb_Trace.stage("open", part=partFileName):
+                    part_doc = documentCache.openDocument(
+                        os.path.join(partsDir, partFileName))
+                topObjects[sourcePartPath] = getPartObject(part_doc)
+                if topObjects[sourcePartPath] is None:
+                    FreeCAD.Console.PrintError(
+                        f"PartsToolbox Error: file {partFileName} has no suitable objects to copy!\n")
+            if not cachedShapes and not any(topObjects.values()):
+                # none of the parts could be read
+                return []
+            newObjects = []
+            # brep file -> loaded shape
+            loadedShapes = {}
+            # link arrays added to so far, for addLinkArrayElement
+            linkArrays = {}
+            arrayNames = set()
+            doc.openTransaction("Insert toolbox parts")
+            try:
+                for number, (sourcePartPath, importMode, placement,
+                             size) in enumerate(entries):
+                    if number in cachedShapes:
+                        with PTb_Trace.stage("add cached shape"):
+                            obj = addCachedShape(doc, sourcePartPath,
+                                                 *cachedShapes[number], size,
+                                                 loadedShapes)
+                        if placement is not None:
+                            obj.Placement = placement
+                        newObjects.append(obj)
+                        continue
+                    top_obj = topObjects[sourcePartPath]
+                    if top_obj is None:
+                        continue
+                    if importMode == 3:
+                        with PTb_Trace.stage("add array element"):
+                            link = addLinkArrayElement(doc, top_obj, size,
+                                                       placement, linkArrays)
+                        if link.Name not in arrayNames:
+                            arrayNames.add(link.Name)
+                            newObjects.append(link)
+                        continue
+                    with PTb_Trace.stage("add object", mode=importMode):
+                        obj = addPartObject(doc, top_obj, importMode)
+                    if obj is None:
+                        continue
+                    if size:
+                        setPartSize(obj, size)
+                    if placement is not None:
+                        obj.Placement = placement
+                    newObjects.append(obj)
+            except Exception:
+                doc.abortTransaction()
+                raise
+            doc.commitTransaction()
+        # set the active document back to the users project:
+        # NOTE: FreeCAD.setActiveDocument(x) != FreeCAD.Gui.setActiveDocument(x)
         FreeCAD.setActiveDocument(doc.Name)
-        FreeCAD.Gui.runCommand("Std_Paste", 0)
-    # set the active document back to the users project:
-    # NOTE: FreeCAD.setActiveDocument(x) != FreeCAD.Gui.setActiveDocument(x)
-    FreeCAD.setActiveDocument(doc.Name)
-    FreeCAD.ActiveDocument.recompute()
-    return
+        if newObjects:
+            with PTb_Trace.stage("recompute", objects=len(newObjects)):
+                doc.recompute(newObjects)
+    return newObjects
+
+
+# import modes by the names used in parts lists
+importModeNames = {"binder": 0, "shapebinder": 0, "link": 1, "copy": 2,
+                   "array": 3, "linkarray": 3}
+
+
+# number columns of parts lists, with their default values
+partsListNumbers = {"x": 0, "y": 0, "z": 0, "yaw": 0, "pitch": 0, "roll": 0,
+                    "count": 1}
+
+
+def badCell(csvPath, lineNo, column, problem):
+    FreeCAD.Console.PrintError(
+        f"PartsToolbox Error: {csvPath} line {lineNo}, column {column}: "
+        f"{problem}. Skipping this row\n")
+
+
+def readPartsList(csvPath):
+    """
+    read a bill of materials from a csv file, for insertParts.
+    The first row names the columns:
+     - Part: a library document, by file name or full path (required)
+     - Mode: binder, link, copy or array, or the number of the
+       import mode
+     - Size: see setPartSize
+     - X, Y, Z: position in mm
+     - Yaw, Pitch, Roll: rotation in degrees
+     - Count: number of instances to insert
+    Column names are not case sensitive, and all but Part are optional.
+    Rows with an unknown part or mode, or a number that can't be read,
+    are reported and skipped
+    """
+    entries = []
+    with open(csvPath, 'r', newline='', encoding="utf-8-sig") as f:
+        for lineNo, row in enumerate(csv.DictReader(f), 2):
+            row = {k.strip().lower(): v or ""
+                   for k, v in row.items() if k}
+            # some library file names start with a space, so the part
+            # name is only stripped if it isn't found as it is
+            part = row.get("part", "")
+            row = {k: v.strip() for k, v in row.items()}
+            if not part.strip():
+                continue
+            partPath = part if os.path.isabs(part) \
+                else findLibraryDocument(part) or \
+                findLibraryDocument(part.strip())
+            if partPath is None or not os.path.exists(partPath):
+                FreeCAD.Console.PrintError(
+                    f"PartsToolbox Error: {csvPath} line {lineNo}: "
+                    f"no library part named {part}\n")
+                continue
+            mode = row.get("mode") or "0"
+            if mode.isdigit() and int(mode) in importModeNames.values():
+                mode = int(mode)
+            elif mode.lower() in importModeNames:
+                mode = importModeNames[mode.lower()]
+            else:
+                badCell(csvPath, lineNo, "Mode", f"unknown import mode {mode}")
+                continue
+            numbers = {}
+            for key, default in partsListNumbers.items():
+                convert = int if key == "count" else float
+                try:
+                    numbers[key] = convert(row.get(key) or default)
+                except ValueError:
+                    badCell(csvPath, lineNo, key.capitalize(),
+                            f"'{row[key]}' is not a number")
+                    break
+            if len(numbers) < len(partsListNumbers):
+                continue
+            if numbers["count"] < 0:
+                badCell(csvPath, lineNo, "Count",
+                        "can't insert a negative number of parts")
+                continue
+            placement = None
+            if any(row.get(x) for x in ("x", "y", "z", "yaw", "pitch", "roll")):
+                placement = FreeCAD.Placement(
+                    FreeCAD.Vector(numbers["x"], numbers["y"], numbers["z"]),
+                    FreeCAD.Rotation(numbers["yaw"], numbers["pitch"],
+                                     numbers["roll"]))
+            count = numbers["count"]
+            entries.extend([(partPath, mode, placement, row.get("size"))]
+                           * count)
+    return entries
+
+
@@ -26,9 +26,20 @@
 
 import FreeCAD
 import os
-from PySide import QtGui, QtUiTools, QtCore
+from PySide import QtGui, QtCore
 from PTb_Base import UIPath, objpath, UserParams
-from PTb_FCFileTools import InsertParamObj, getFCFiles, getDataFromFCFile
+from PTb_FCFileTools import InsertParamObj
+from PTb_Library import getLibraryIndex
+from PTb_LibraryModel import PartLibraryModel
+from PTb_LibraryWatcher import getLibraryWatcher
+from PTb_Search import LibrarySearchIndex
+from PTb_Thumbnails import ThumbnailCache
+import PTb_Trace
+
+# most parts listed at once while filtering
+maxFilterHits = 500
+# thumbnails of this many parts above and below the selection are preloaded
+prefetchDistance = 32
 
 
 def ToggleToolboxDock():
@@ -46,29 +57,96 @@ def ToggleToolboxDock():
         pe.setVisible(pe.isHidden())
 
 
+class LibraryScanner(QtCore.QObject):
+    """
+    Reads the parts libraries in a background thread, and hands the
+    parts over to the dock as they are read, in batches of one top
+    level category each
+    """
+    # list of (file path, [categories], index record) tuples
+    batchReady = QtCore.Signal(object)
+    finished = QtCore.Signal()
+
+    def __init__(self, libraries, traceSession=None):
+        """
+        libraries is a list of (library folder, [category prefix]) tuples.
+        The scan is timed as part of the PTb_Trace session traceSession
+        """
+        super(LibraryScanner, self).__init__()
+        self.libraries = libraries
+        self.traceSession = traceSession
+
+    def run(self):
+        # finished is always sent, so the dock doesn't wait forever for
+        # a scan that failed
+        try:
+            with PTb_Trace.attach(self.traceSession):
+                for path, prefix in self.libraries:
+                    self.readObjTypes(
+                        path, lambda parts, prefix=prefix: self.emitBatches(
+                            [(fullpath, prefix + cats, record)
+                             for fullpath, cats, record in parts]))
+        finally:
+            self.finished.emit()
+
+    def emitBatches(self, parts):
+        """
+        hand a list of parts over to the dock, one batch per top level
+        category
+        """
+        batches = {}
+        for part in parts:
+            cats = part[1]
+            batches.setdefault(cats[:1] and cats[0], []).append(part)
+        for batch in batches.values():
+            self.batchReady.emit(batch)
+
+    def readObjTypes(self, path, onParts):
+        """
+        given a path to a parts library folder 'path', pass the
+        contents of the property Part.Type of each part, split into
+        individual strings where '|' is used as the delimiter, along
+        with the rest of the index record of the part, to onParts.
+        Metadata is taken from the library index, so only parts that
+        changed since the last time are actually read. Parts are passed
+        on as soon as they are read, a few dozen at a time, so the tree
+        fills up while the scan goes on
+        """
+        index = getLibraryIndex(path)
+        with PTb_Trace.stage("scan", root=path):
+            index.refresh(onRecords=lambda records: onParts(
+                [(fullpath, record["Categories"], record)
+                 for fullpath, record in records]))
+
+
 class ToolboxDock(QtGui.QDockWidget):
     def __init__(self) -> None:
         mw = FreeCAD.Gui.getMainWindow()
         super(ToolboxDock, self).__init__()  # run inherited class constructor
         self.setParent(mw)
         self.setObjectName("ToolboxBrowser")
-        self.setWindowTitle("Toolbox Browser")
+        self.setWindowTitle("Toolbox Browser (scanning\u2026)")
+        # loading QtUiTools is slow, so it waits until a dock is made
+        from PySide import QtUiTools
         UIFilePath = os.path.join(UIPath, "ToolboxBrowserWidget.ui")
         self.UI = QtUiTools.QUiLoader().load(UIFilePath)
         self.setWidget(self.UI)
         # configure the UI with our data and functions
-        # import object hierarchy
-        self.ObjHierarchy = self.readObjTypes(objpath)
+        # the parts are filled in by the library scanner as they come in
+        self.model = PartLibraryModel(self)
+        self.UI.treeView.setModel(self.model)
+        self.searchIndex = LibrarySearchIndex()
+        self.thumbnails = ThumbnailCache(parent=self)
+        # file path -> (modification time, size) from the library index,
+        # which picks the version of the thumbnail to show
+        self.partStamps = {}
+        self.UI.label.setText("Scanning\u2026")
+        libraries = [(objpath, [])]
         userpath = UserParams.GetString("UserObjPath")
         if userpath:
             # prefix user objects with the 'User' category so that they are
             # placed in their own top level folder:
-            self.ObjHierarchy += [(x[0], ["User"]+x[1])
-                                  for x in self.readObjTypes(userpath)]
-        # store locations of files for reference
-        self.objectpaths = {os.path.basename(x[0]).removesuffix(
-            ".FCStd"): x[0] for x in self.ObjHierarchy}
-        self.populate_tree()
+            libraries.append((userpath, ["User"]))
         # set the import mode to the users preferred default
         self.UI.comboBox.setCurrentIndex(
             UserParams.GetInt("DefaultImportType"))
@@ -76,82 +154,149 @@ class ToolboxDock(QtGui.QDockWidget):
         # (it can't do anything until the user selects a part to add)
         self.UI.buttonBox.button(QtGui.QDialogButtonBox.Ok).setEnabled(False)
         # connect signals
-        self.UI.treeWidget.clicked.connect(self.selectionChanged)
+        # follows the keyboard as well as the mouse
+        self.UI.treeView.selectionModel().currentChanged.connect(
+            self.selectionChanged)
+        self.UI.filterEdit.textChanged.connect(self.filterChanged)
+        self.UI.filterEdit.returnPressed.connect(self.insertTopHit)
+        # only while the dock has focus, so we don't take over ctrl+f
+        # in the rest of FreeCAD
+        findShortcut = QtGui.QShortcut(QtGui.QKeySequence.Find, self)
+        findShortcut.setContext(QtCore.Qt.WidgetWithChildrenShortcut)
+        findShortcut.activated.connect(self.UI.filterEdit.setFocus)
         self.UI.buttonBox.accepted.connect(
-            lambda: InsertParamObj(self.objectpaths[self.UI.treeWidget.currentItem().text(0)],
+            lambda: InsertParamObj(self.model.partPath(self.UI.treeView.currentIndex()),
                                    self.UI.comboBox.currentIndex()))
         self.UI.show()
+        # read the libraries without blocking the GUI
+        self.scanThread = QtCore.QThread(self)
+        # the scan gets a session of its own, parts inserted while it
+        # goes on are timed separately
+        self.traceSession = PTb_Trace.newSession("library scan")
+        self.scanner = LibraryScanner(libraries, self.traceSession)
+        self.scanner.moveToThread(self.scanThread)
+        self.scanThread.started.connect(self.scanner.run)
+        self.scanner.batchReady.connect(self.addParts)
+        self.scanner.finished.connect(self.scanFinished)
+        self.scanner.finished.connect(self.scanThread.quit)
+        self.scanThread.start()
+        # pick up parts that are added or edited from now on
+        self.libraryPrefixes = {}
+        watcher = getLibraryWatcher()
+        for path, prefix in libraries:
+            self.libraryPrefixes[os.path.normpath(os.path.abspath(path))] = \
+                prefix
+            watcher.watch(path)
+        watcher.documentsChanged.connect(self.libraryChanged)
 
-    def readObjTypes(self, path):
+    def addParts(self, parts):
         """
-        given a path to a parts library part 'path', return the contents
-        of the property Part.Type, split into individual strings where
-        '|' is used as the delimiter 
+        add a batch of (file path, [categories], index record) tuples
+        to the browser. Parts that are already in it are updated
         """
-        data = []
-        for item in getFCFiles(path):
-            fullpath = os.path.join(path, item)
-            catStr = getDataFromFCFile(fullpath)["Type"]
-            data.append((fullpath, [x for x in catStr.split("|") if x != ""]))
-        return data
-
-    def populate_tree(self):
+        for fullpath, cats, record in parts:
+            self.partStamps[fullpath] = (record["mtime"], record["size"])
+        with PTb_Trace.attach(self.traceSession):
+            with PTb_Trace.stage("tree", parts=len(parts)):
+                self.model.updateParts(parts)
+            with PTb_Trace.stage("search index", parts=len(parts)):
+                for fullpath, cats, record in parts:
+                    self.searchIndex.add(
+                        fullpath,
+                        os.path.basename(fullpath).removesuffix(".FCStd"),
+                        cats, record["Id"])
+        if self.UI.filterEdit.text().strip():
+            self.filterChanged(self.UI.filterEdit.text())
+
+    def libraryChanged(self, root, updated, removed):
+        """
+        apply changes made to the library folder 'root' while the
+        browser is open, keeping the selected part selected
+        """
+        prefix = self.libraryPrefixes.get(root)
+        if prefix is None:
+            return
+        current = self.model.partPath(self.UI.treeView.currentIndex())
+        for path in removed:
+            self.searchIndex.remove(path)
+            self.thumbnails.forget(path)
+            self.partStamps.pop(path, None)
+        for path, record in updated:
+            self.thumbnails.forget(path)
+        self.model.removeParts(removed)
+        self.addParts([(path, prefix + record["Categories"], record)
+                       for path, record in updated])
+        if current and current in self.model.partNodes and \
+                self.model.partPath(self.UI.treeView.currentIndex()) != current:
+            # moved to another category, or lost in a new filter result
+            self.UI.treeView.setCurrentIndex(self.model.pathIndex(current))
+        self.selectionChanged()
+
+    def filterChanged(self, text):
         '''
-        Fill the tree view widget with an organized hierarchy
-        of available parts
+        show only the parts matching the text in the filter box
         '''
-        PartIcon = FreeCAD.Gui.getIcon("PartsToolbox_Part")
-        FolderIcon = FreeCAD.Gui.getIcon("Group")
-        for i, cats in self.ObjHierarchy:
-            # repeatedly add categories
-            currentParent = self.UI.treeWidget
-            for cat in cats:
-                subobj = self.treeHasChild(cat, currentParent)
-                if not subobj:
-                    subobj = QtGui.QTreeWidgetItem(currentParent)
-                subobj.setIcon(0, FolderIcon)
-                subobj.setText(0, cat)
-                currentParent = subobj
-            # add the object to the bottom level category
-            subobj = QtGui.QTreeWidgetItem(currentParent)
-            subobj.setIcon(0, PartIcon)
-            subobj.setText(0, os.path.basename(i).removesuffix(".FCStd"))
-
-    def treeHasChild(self, text, QTreeObj):
+        if text.strip():
+            self.model.setHits(self.searchIndex.query(text, maxFilterHits))
+        else:
+            self.model.setHits(None)
+        self.selectionChanged()
+
+    def insertTopHit(self):
         '''
-        If a QTreeWidget _OR_ a QTreeWidgetItem has a child
-        with specific text in column 0, return that child item.
-        Otherwise, return None.
+        add the best match for the filter text to the active document
         '''
-        if type(QTreeObj) == QtGui.QTreeWidget:
-            x = QTreeObj.findItems(text, QtCore.Qt.MatchFixedString)
-            if x:
-                return x[0]
-        else:
-            for i in range(QTreeObj.childCount()):
-                child = QTreeObj.child(i)
-                if child.text(0) == text:
-                    return child
-        return None
+        if not self.model.hits:
+            return
+        topHit = self.model.index(0, 0)
+        self.UI.treeView.setCurrentIndex(topHit)
+        self.selectionChanged()
+        InsertParamObj(self.model.partPath(topHit),
+                       self.UI.comboBox.currentIndex())
+
+    def scanFinished(self):
+        '''
+        clear the 'scanning' notice once all parts are in
+        '''
+        if self.UI.label.text():
+            self.UI.label.clear()
+        self.setWindowTitle("Toolbox Browser")
+        if self.traceSession:
+            # the last batches are in the tree by now, so they are counted
+            self.traceSession.end()
 
     def selectionChanged(self):
         '''
         this runs every time the user selects a different part in the tree view
         '''
         OKButton = self.UI.buttonBox.button(QtGui.QDialogButtonBox.Ok)
-        selectedTreeItem = self.UI.treeWidget.currentItem()
-        if selectedTreeItem:
-            # if a category is selected, disable the add button:
-            if selectedTreeItem.childCount() > 0:
-                OKButton.setEnabled(False)
-                self.UI.label.setPixmap(None)
-            else:
-                OKButton.setEnabled(True)
-                # update thumbnail
-                imagePath = os.path.join(
-                    objpath, selectedTreeItem.text(0), "thumbnails/Thumbnail.png")
-                # this fails silently if no thumbnail is found
-                pixmap = QtGui.QPixmap(imagePath)
-                self.UI.label.setPixmap(pixmap)
+        partPath = self.model.partPath(self.UI.treeView.currentIndex())
+        # if a category is selected, disable the add button:
+        if not partPath:
+            OKButton.setEnabled(False)
+            self.UI.label.clear()
         else:
             OKButton.setEnabled(True)
+            # update thumbnail. this shows nothing if no thumbnail is found
+            self.UI.label.setPixmap(self.thumbnails.pixmap(
+                partPath, self.partStamps.get(partPath)))
+            self.prefetchThumbnails()
+
+    def prefetchThumbnails(self):
+        '''
+        start loading the thumbnails of the parts next to the selected
+        one, nearest first, so that moving through a category with the
+        arrow keys doesn't have to wait for the disk
+        '''
+        current = self.UI.treeView.currentIndex()
+        parent = current.parent()
+        rowCount = self.model.rowCount(parent)
+        paths = []
+        for distance in range(1, min(rowCount, prefetchDistance + 1)):
+            for row in (current.row() + distance, current.row() - distance):
+                if 0 <= row < rowCount:
+                    path = self.model.partPath(
+                        self.model.index(row, 0, parent))
+                    if path:
+                        paths.append((path, self.partStamps.get(path)))
+        self.thumbnails.prefetch(paths)
@@ -0,0 +1,465 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# keep track of the contents of parts library folders without having
+# to reparse every document each time the library is browsed
+#
+
+import FreeCAD
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+from concurrent.futures import (ProcessPoolExecutor, ThreadPoolExecutor,
+                                as_completed)
+from zipfile import ZipFile
+from PTb_Base import UserParams
+import PTb_Trace
+from PTb_FCFileTools import (getFCFiles, getDataFromFCFile, getDocumentStamp,
+                             packExtension)
+from PTb_Pack import packRecords, packStamp
+
+# the index is stored in this file in the root of each library folder
+indexFileName = ".PartsToolboxIndex.json"
+# bump this whenever the layout of index records changes
+indexVersion = 1
+thumbnailMember = "thumbnails/Thumbnail.png"
+# below this many documents, starting workers isn't worth it
+minParallelItems = 16
+# below this many documents, worker processes take longer to start than
+# they save, and threads are used instead
+minProcessItems = 200
+# most documents read in one go, so that results come in steadily
+maxChunkSize = 64
+
+# one index per library folder, shared by everything in this session
+_indexes = {}
+
+
+def getLibraryIndex(root):
+    """
+    get the (shared) LibraryIndex of the library folder 'root'.
+    The index is loaded from disk, but not refreshed
+    """
+    root = os.path.normpath(os.path.abspath(root))
+    if root not in _indexes:
+        _indexes[root] = LibraryIndex(root)
+    return _indexes[root]
+
+
+def splitType(typeStr):
+    """
+    split the contents of the property Part.Type into individual
+    categories, where '|' is used as the delimiter
+    """
+    return [x for x in typeStr.split("|") if x != ""]
+
+
+def hashDocument(docPath):
+    """
+    return a hash of the contents of a FreeCAD document.
+    For save-as-directory documents only Document.xml is hashed
+    """
+    if os.path.isdir(docPath):
+        docPath = os.path.join(docPath, "Document.xml")
+    digest = hashlib.blake2b(digest_size=20)
+    with open(docPath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def getThumbnailMember(docPath):
+    """
+    return the location of the thumbnail image inside a document,
+    or an empty string if the document has no thumbnail
+    """
+    if os.path.isdir(docPath):
+        if os.path.isfile(os.path.join(docPath, thumbnailMember)):
+            return thumbnailMember
+    else:
+        with ZipFile(docPath, 'r') as zippedFCStd:
+            if thumbnailMember in zippedFCStd.namelist():
+                return thumbnailMember
+    return ""
+
+
+def readDocumentRecord(docPath):
+    """
+    read everything the index stores about a single document
+    """
+    mtime, size = getDocumentStamp(docPath)
+    record = {
+        "mtime": mtime,
+        "size": size,
+        "hash": hashDocument(docPath),
+    }
+    record.update(getDataFromFCFile(docPath))
+    record["Categories"] = splitType(record["Type"])
+    record["Thumbnail"] = getThumbnailMember(docPath)
+    return record
+
+
+def getWorkerCount():
+    """
+    number of workers to use for library scans,
+    as set in the PartsToolbox preferences. 0 means one per cpu core
+    """
+    workers = UserParams.GetInt("ScanWorkers")
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    return workers
+
+
+def _callSafely(func, item):
+    """
+    run func(item) and return a (result, error message) pair
+    instead of raising
+    """
+    try:
+        return (func(item), None)
+    except Exception as e:
+        return (None, f"{type(e).__name__}: {e}")
+
+
+def _callChunk(func, items):
+    return [_callSafely(func, item) for item in items]
+
+
+def canSpawnWorkers():
+    """
+    whether worker processes can be started here. That takes a plain
+    python interpreter to spawn them with: inside FreeCAD,
+    sys.executable is FreeCAD itself. Forking instead could leave the
+    child stuck on a lock held by one of FreeCADs Qt or OpenCASCADE
+    threads, so it isn't used at all
+    """
+    if getattr(FreeCAD, "GuiUp", False):
+        return False
+    name = os.path.basename(sys.executable or "").lower()
+    return name.startswith("python")
+
+
+def runParallel(func, items, workers=None, onChunk=None, processes=None):
+    """
+    call func on each of 'items', spread over a pool of workers.
+    Returns a list of (item, result, error) tuples in the same order
+    as 'items', so the outcome doesn't depend on which worker finished
+    first. An exception raised for one item is reported as its error
+    message and doesn't stop the others.
+    If given, onChunk is called in this thread with the list of
+    (item, result, error) tuples of each chunk of items as it is done,
+    in the order they finish.
+    Parsing documents is mostly python work, which only scales over
+    processes. Those are used when 'processes' is set (to True, or to
+    the multiprocessing context to start them with), by default when
+    there are many items and canSpawnWorkers() allows it (from the
+    command line, say). func then has to be a module level function.
+    Otherwise, like inside FreeCAD, the workers are threads
+    """
+    items = list(items)
+    if workers is None:
+        workers = getWorkerCount()
+    if len(items) < minParallelItems:
+        workers = 1
+    if processes is None:
+        processes = len(items) >= minProcessItems and canSpawnWorkers()
+    # hand out a few chunks per worker so they stay busy until the end
+    chunkSize = max(1, min(len(items) // (workers * 4), maxChunkSize))
+    chunks = [items[i:i+chunkSize] for i in range(0, len(items), chunkSize)]
+    outcomes = [None] * len(chunks)
+
+    def done(number, chunkOutcomes):
+        outcomes[number] = [(item,) + outcome for item, outcome
+                            in zip(chunks[number], chunkOutcomes)]
+        if onChunk:
+            onChunk(outcomes[number])
+
+    if workers <= 1:
+        for number, chunk in enumerate(chunks):
+            done(number, _callChunk(func, chunk))
+    else:
+        if processes:
+            if processes is True:
+                # spawned, not forked, see canSpawnWorkers
+                processes = multiprocessing.get_context("spawn")
+            pool = ProcessPoolExecutor(max_workers=workers,
+                                       mp_context=processes)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers)
+        with pool:
+            futures = {pool.submit(_callChunk, func, chunk): number
+                       for number, chunk in enumerate(chunks)}
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+    return [x for chunk in outcomes for x in chunk]
+
+
+class LibraryIndex:
+    """
+    Metadata of all documents in a parts library folder.
+
+    Records are keyed by the documents file name, and hold the
+    metadata returned by getDataFromFCFile along with the documents
+    modification time, size and content hash. Documents whose
+    modification time and size are unchanged are never parsed again.
+    The index is saved to a json file in the library folder, or to the
+    FreeCAD user data directory if the library folder is read-only
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.entries = {}
+        # the dock refreshes the index from a background thread
+        self.lock = threading.RLock()
+        self.load()
+
+    def indexPaths(self):
+        """
+        possible locations of the index file, in order of preference
+        """
+        fallbackName = hashlib.sha1(self.root.encode()).hexdigest() + ".json"
+        return [
+            os.path.join(self.root, indexFileName),
+            os.path.join(FreeCAD.getUserAppDataDir(), "PartsToolbox",
+                         "LibraryIndex", fallbackName),
+        ]
+
+    def load(self):
+        """
+        read the index file from disk. a missing, unreadable or
+        outdated index file leaves the index empty
+        """
+        self.entries = {}
+        for path in self.indexPaths():
+            try:
+                with open(path, 'r', encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if data.get("version") == indexVersion:
+                self.entries = data["entries"]
+                return
+
+    def save(self):
+        """
+        write the index to disk, replacing the old file atomically
+        """
+        data = {"version": indexVersion, "entries": self.entries}
+        for path in self.indexPaths():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmpPath = tempfile.mkstemp(
+                    dir=os.path.dirname(path), suffix=".tmp")
+            except OSError:
+                continue
+            try:
+                with os.fdopen(fd, 'w', encoding="utf-8") as f:
+                    json.dump(data, f, separators=(",", ":"))
+                os.replace(tmpPath, path)
+                return
+            except OSError:
+                if os.path.exists(tmpPath):
+                    os.remove(tmpPath)
+        FreeCAD.Console.PrintWarning(
+            f"PartsToolbox: could not save the library index of {self.root}\n")
+
+    def refresh(self, workers=None, names=None, onRecords=None):
+        """
+        bring the index up to date with the library folder.
+        Only documents that were added or changed since the last
+        refresh are parsed, with up to 'workers' workers at once.
+        If a list of document names is given, only those documents
+        are looked at, instead of the whole folder.
+        Documents that can't be read are reported, and remembered
+        so they aren't retried until they change.
+        onRecords, if given, is called with lists of (full path,
+        record) pairs as they become available: first the documents
+        that didn't need parsing, then each batch of parsed documents.
+        Documents that can't be read are left out, as in records().
+        Returns the names of the added, changed and removed documents
+        """
+        with self.lock:
+            return self._refresh(workers, names, onRecords)
+
+    def isDocument(self, name):
+        """
+        whether there is a FreeCAD document called 'name' in the
+        library folder, as getFCFiles would find it
+        """
+        docPath = self.path(name)
+        if os.path.isdir(docPath):
+            return os.path.isfile(os.path.join(docPath, "Document.xml"))
+        return name.endswith(".FCStd") and os.path.isfile(docPath)
+
+    def _refresh(self, workers, names, onRecords):
+        with PTb_Trace.stage("getFCFiles", root=self.root):
+            if names is None:
+                checked = set(self.entries)
+                names = set(getFCFiles(self.root))
+                packs = sorted(x for x in os.listdir(self.root)
+                               if x.endswith(packExtension))
+            else:
+                checked = set(names)
+                names = {x for x in checked if self.isDocument(x)}
+                packs = []
+        packed = {}
+        for pack in packs:
+            packed.update(self._readPack(pack))
+        removed = sorted(checked.intersection(self.entries) - names -
+                         set(packed))
+        added = []
+        changed = []
+        stale = []
+        # documents deleted or renamed since the folder was listed
+        gone = []
+        dirty = bool(removed)
+        for name in removed:
+            del self.entries[name]
+        for name, record in packed.items():
+            old = self.entries.get(name)
+            if old is record:
+                continue
+            dirty = True
+            if old is None:
+                added.append(name)
+            elif old.get("hash") != record.get("hash"):
+                changed.append(name)
+            self.entries[name] = record
+        for name in sorted(names):
+            docPath = os.path.join(self.root, name)
+            record = self.entries.get(name)
+            if record is None:
+                added.append(name)
+                stale.append(name)
+                continue
+            try:
+                stamp = getDocumentStamp(docPath)
+                if stamp == (record["mtime"], record["size"]):
+                    continue
+                dirty = True
+                touched = "error" not in record and \
+                    hashDocument(docPath) == record["hash"]
+            except OSError:
+                gone.append(name)
+                continue
+            if touched:
+                # touched, but not actually modified
+                record["mtime"], record["size"] = stamp
+                continue
+            changed.append(name)
+            stale.append(name)
+        # full path -> name, of the documents to parse
+        staleNames = {self.path(x): x for x in stale}
+        if onRecords:
+            onRecords([(docPath, record) for docPath, record in self.records()
+                       if docPath not in staleNames])
+
+        def store(results):
+            ready = []
+            for docPath, record, error in results:
+                if error:
+                    try:
+                        mtime, size = getDocumentStamp(docPath)
+                    except OSError:
+                        gone.append(staleNames[docPath])
+                        continue
+                    FreeCAD.Console.PrintWarning(
+                        f"PartsToolbox: skipping {docPath}: {error}\n")
+                    record = {"mtime": mtime, "size": size, "error": error}
+                else:
+                    ready.append((docPath, record))
+                self.entries[staleNames[docPath]] = record
+            if onRecords and ready:
+                onRecords(ready)
+
+        # documents are parsed by workers, so they are timed
+        # all together
+        with PTb_Trace.stage("getDataFromFCFile", documents=len(stale)):
+            runParallel(readDocumentRecord, list(staleNames), workers,
+                        onChunk=store)
+        for name in gone:
+            # as if it had been removed before the refresh
+            dirty = True
+            if name in added:
+                added.remove(name)
+                continue
+            if name in changed:
+                changed.remove(name)
+            if self.entries.pop(name, None) is not None:
+                removed.append(name)
+        removed.sort()
+        if dirty or stale:
+            with PTb_Trace.stage("save index"):
+                self.save()
+        return added, changed, removed
+
+    def _readPack(self, pack):
+        """
+        return the entries of the documents in the pack file 'pack'.
+        The entries already in the index are kept if the pack hasn't
+        changed, otherwise the index at the front of the pack is read
+        """
+        prefix = pack + "/"
+        current = {name: record for name, record in self.entries.items()
+                   if name.startswith(prefix)}
+        try:
+            stamp = packStamp(self.path(pack))
+            if current and all((x["mtime"], x["size"]) == stamp
+                               for x in current.values()):
+                return current
+            return {prefix + name: record for name, record
+                    in packRecords(self.path(pack)).items()}
+        except (OSError, ValueError) as e:
+            FreeCAD.Console.PrintWarning(
+                f"PartsToolbox: skipping {self.path(pack)}: {e}\n")
+            return {}
+
+    def path(self, name):
+        """
+        full path to the document called 'name'.
+        Packed documents are named 'pack/document'
+        """
+        return os.path.join(self.root, name)
+
+    def records(self):
+        """
+        list of (full path, record) pairs sorted by document name.
+        Documents that couldn't be read are left out
+        """
+        with self.lock:
+            return [(self.path(name), self.entries[name])
+                    for name in sorted(self.entries)
+                    if "error" not in self.entries[name]]
+
+    def errors(self):
+        """
+        dict of the documents that couldn't be read, with the reason
+        """
+        with self.lock:
+            return {self.path(name): record["error"]
+                    for name, record in sorted(self.entries.items())
+                    if "error" in record}
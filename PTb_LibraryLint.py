@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# check the documents of a parts library for problems, without opening
+# them in FreeCAD. Can be run from the command line, with either
+#   FreeCADCmd PTb_LibraryLint.py --pass [options] LIBRARY_FOLDER...
+# or, with the FreeCAD lib folder on PYTHONPATH,
+#   python PTb_LibraryLint.py [options] LIBRARY_FOLDER...
+# a json report is written to stdout (or the file given with --output).
+# The exit status is 1 if any errors were found
+#
+
+import argparse
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+import FreeCAD
+import defusedxml.ElementTree as tree
+from PTb_FCFileTools import (getFCFiles, openDocumentXml, readPartMetadata,
+                             getLinkedFileNames, resolveLinkPath)
+from PTb_Library import canSpawnWorkers, getThumbnailMember, runParallel
+
+# objects that can be inserted from a library document
+partObjectNames = ("Part", "Body")
+_urlPattern = re.compile(r"https?://\S+$")
+
+
+def problem(level, check, message):
+    return {"level": level, "check": check, "message": message}
+
+
+def readObjectNames(xmlData):
+    """
+    return the names of all objects in a Document.xml file, read from
+    its Objects section (which comes before all object data)
+    """
+    names = []
+    depth = 0
+    for event, elem in tree.iterparse(io.BytesIO(xmlData),
+                                      events=("start", "end")):
+        if event == "start":
+            depth += 1
+            if depth == 3 and elem.tag == "Object":
+                names.append(elem.get("name"))
+            continue
+        depth -= 1
+        if depth == 1 and elem.tag == "Objects":
+            break
+    return names
+
+
+def checkType(typeStr):
+    """
+    problems with the '|' delimited category path in Part.Type
+    """
+    if not typeStr.strip():
+        return [problem("error", "type", "Part.Type is empty")]
+    cats = typeStr.split("|")
+    if any(not x.strip() for x in cats):
+        return [problem("error", "type",
+                        f"Part.Type '{typeStr}' has an empty category")]
+    if any(x != x.strip() for x in cats):
+        return [problem("warning", "type",
+                        f"Part.Type '{typeStr}' has spaces around a category")]
+    return []
+
+
+def lintDocument(docPath):
+    """
+    check a single library document. Returns a dict with the documents
+    path, Id, the time the checks took and a list of problems found
+    """
+    start = time.perf_counter()
+    problems = []
+    partId = None
+    with openDocumentXml(docPath) as docFile:
+        xmlData = docFile.read()
+    objects = readObjectNames(xmlData)
+    if not any(x in objects for x in partObjectNames):
+        problems.append(problem("error", "object",
+                                "document has no Part or Body object"))
+    if "Part" in objects:
+        metadata = readPartMetadata(io.BytesIO(xmlData), docPath)
+        problems.extend(checkType(metadata["Type"]))
+        partId = metadata["Id"]
+        if partId in ("", "???"):
+            # parametric parts often leave this to the configuration
+            problems.append(problem("warning", "id", "Part.Id is not set"))
+        if not metadata["License"]:
+            problems.append(problem("error", "license",
+                                    "Part.License is empty"))
+        if not _urlPattern.match(metadata["LicenseURL"]):
+            problems.append(problem(
+                "warning", "license",
+                f"Part.LicenseURL '{metadata['LicenseURL']}' is not a url"))
+    elif objects:
+        problems.append(problem("error", "object",
+                                "document has no Part object with metadata"))
+    if not getThumbnailMember(docPath):
+        problems.append(problem("warning", "thumbnail",
+                                "document has no thumbnail"))
+    for fileName in getLinkedFileNames(xmlData):
+        if resolveLinkPath(docPath, fileName) is None:
+            problems.append(problem("error", "dependency",
+                                    f"linked document {fileName} not found"))
+    return {
+        "file": docPath,
+        "Id": partId,
+        "time": time.perf_counter() - start,
+        "problems": problems,
+    }
+
+
+def workerContext():
+    """
+    how to start the worker processes: spawned from a plain python, and
+    forked under FreeCADCmd, whose executable can't spawn python
+    workers. Without the GUI there are no Qt threads whose locks a
+    forked child could inherit. None if processes can't be used
+    """
+    if canSpawnWorkers():
+        return multiprocessing.get_context("spawn")
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def lintLibrary(root, workers=None):
+    """
+    check every document in the library folder 'root', spread over
+    'workers' processes. Returns a report dict
+    """
+    start = time.perf_counter()
+    paths = [os.path.join(root, x) for x in sorted(getFCFiles(root))]
+    documents = []
+    for docPath, result, error in runParallel(
+            lintDocument, paths, workers, processes=workerContext()):
+        if error:
+            result = {"file": docPath, "Id": None, "time": 0.0,
+                      "problems": [problem("error", "read", error)]}
+        documents.append(result)
+    # Ids have to be unique across the library
+    byId = {}
+    for result in documents:
+        if result["Id"] not in (None, "", "???"):
+            byId.setdefault(result["Id"], []).append(result)
+    for partId, results in byId.items():
+        if len(results) > 1:
+            for result in results:
+                others = [x["file"] for x in results if x is not result]
+                result["problems"].append(problem(
+                    "error", "id", f"Id '{partId}' is also used by "
+                    + ", ".join(others)))
+    counts = {"error": 0, "warning": 0}
+    for result in documents:
+        for x in result["problems"]:
+            counts[x["level"]] += 1
+    return {
+        "root": root,
+        "files": len(documents),
+        "errors": counts["error"],
+        "warnings": counts["warning"],
+        "time": time.perf_counter() - start,
+        "documents": documents,
+    }
+
+
+def scriptArguments():
+    """
+    the command line arguments meant for this script. FreeCADCmd
+    passes on the arguments after '--pass'
+    """
+    args = sys.argv[1:]
+    for n, arg in enumerate(sys.argv):
+        if arg == "--pass" or arg.endswith("PTb_LibraryLint.py"):
+            args = sys.argv[n+1:]
+    return [x for x in args if x != "--pass"]
+
+
+def main(args):
+    parser = argparse.ArgumentParser(
+        prog="PTb_LibraryLint",
+        description="check the documents of a FreeCAD parts library")
+    parser.add_argument("roots", nargs="+", metavar="LIBRARY_FOLDER")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="number of worker processes")
+    parser.add_argument("-o", "--output", help="write the report here")
+    parser.add_argument("-q", "--only-problems", action="store_true",
+                        help="leave documents without problems out")
+    options = parser.parse_args(args)
+    reports = [lintLibrary(x, options.workers) for x in options.roots]
+    if options.only_problems:
+        for report in reports:
+            report["documents"] = [x for x in report["documents"]
+                                   if x["problems"]]
+    text = json.dumps(reports, indent=1)
+    if options.output:
+        with open(options.output, 'w', encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if any(x["errors"] for x in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(scriptArguments()))
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# Qt item model behind the toolbox browser tree
+#
+
+import FreeCAD
+import os
+from PySide import QtCore
+
+# rows handed to the view per fetchMore call
+fetchChunkSize = 500
+
+
+class LibraryNode:
+    """
+    A category or a part in the library tree.
+    Parts have a path and no children
+    """
+    __slots__ = ("name", "parent", "row", "path", "children",
+                 "categories", "fetched")
+
+    def __init__(self, name, parent=None, path=None):
+        self.name = name
+        self.parent = parent
+        # position of this node in parent.children
+        self.row = len(parent.children) if parent else 0
+        self.path = path
+        self.children = [] if path is None else None
+        # sub-categories by name, to find them without a search
+        self.categories = {} if path is None else None
+        # number of children the view has been told about so far
+        self.fetched = 0
+        if parent:
+            parent.children.append(self)
+            if path is None:
+                parent.categories[name] = self
+
+
+class PartLibraryModel(QtCore.QAbstractItemModel):
+    """
+    Tree of library categories and parts.
+
+    All parts are held in a tree of LibraryNode objects. The view is
+    only told about the children of a category once it is expanded
+    (through canFetchMore/fetchMore), so opening the browser costs
+    about the same for ten parts or ten thousand.
+    When a filter is set with setHits, the model shows a flat list of
+    the matching parts instead of the tree
+    """
+
+    def __init__(self, parent=None):
+        super(PartLibraryModel, self).__init__(parent)
+        self.root = LibraryNode("")
+        # part nodes by file path
+        self.partNodes = {}
+        # list of part nodes while a filter is set, otherwise None
+        self.hits = None
+        # categories with children the view hasn't been told about yet,
+        # by the number of children it may fetch. Set while addParts
+        # announces new rows, so a fetchMore from a listener can't hand
+        # out the same rows a second time
+        self.pending = {}
+        self.partIcon = FreeCAD.Gui.getIcon("PartsToolbox_Part")
+        self.folderIcon = FreeCAD.Gui.getIcon("Group")
+
+    def addParts(self, parts):
+        """
+        add a list of (file path, [categories], ...) tuples to the tree
+        """
+        # number of children each touched category had before
+        oldCounts = {}
+        for path, cats, *_ in parts:
+            node = self.root
+            for cat in cats:
+                oldCounts.setdefault(node, len(node.children))
+                node = node.categories.get(cat) or LibraryNode(cat, node)
+            oldCounts.setdefault(node, len(node.children))
+            self.partNodes[path] = LibraryNode(
+                os.path.basename(path).removesuffix(".FCStd"), node, path)
+        if self.hits is not None:
+            # the tree isn't on display. it is caught up in setHits
+            return
+        # the view has to hear about new rows of categories it has
+        # already fetched completely. others get them on fetchMore
+        self.pending = dict(oldCounts)
+        try:
+            for node, oldCount in oldCounts.items():
+                if node.fetched == oldCount and \
+                        (oldCount or node is self.root):
+                    self.beginInsertRows(self.nodeIndex(node),
+                                         oldCount, len(node.children) - 1)
+                    node.fetched = len(node.children)
+                    del self.pending[node]
+                    self.endInsertRows()
+                else:
+                    del self.pending[node]
+        finally:
+            self.pending = {}
+
+    def updateParts(self, parts):
+        """
+        bring the tree up to date with a list of (file path,
+        [categories], ...) tuples: new parts are added, and parts
+        whose categories changed are moved. Other parts are left
+        where they are, so the view keeps its expanded categories
+        and selection
+        """
+        new = [x for x in parts if x[0] not in self.partNodes]
+        moved = [x for x in parts if x[0] in self.partNodes and
+                 self.partCategories(x[0]) != list(x[1])]
+        self.removeParts([x[0] for x in moved])
+        self.addParts(moved + new)
+
+    def removeParts(self, paths):
+        """
+        remove the parts with the file paths 'paths' from the tree,
+        along with the categories they leave empty.
+        While a filter is set, the list of hits is left alone until
+        the next call to setHits
+        """
+        for path in paths:
+            node = self.partNodes.pop(path, None)
+            while node is not None:
+                parent = node.parent
+                self._removeNode(node)
+                node = parent if parent is not self.root and \
+                    not parent.children else None
+
+    def _removeNode(self, node):
+        parent = node.parent
+        row = node.row
+        # the view only knows about fetched rows
+        shown = self.hits is None and row < parent.fetched
+        if shown:
+            self.beginRemoveRows(self.nodeIndex(parent), row, row)
+        del parent.children[row]
+        for sibling in parent.children[row:]:
+            sibling.row -= 1
+        if row < parent.fetched:
+            parent.fetched -= 1
+        if node.path is None:
+            del parent.categories[node.name]
+        if shown:
+            self.endRemoveRows()
+
+    def partCategories(self, path):
+        """
+        the categories of the part 'path', from the top level down
+        """
+        cats = []
+        node = self.partNodes[path].parent
+        while node is not self.root:
+            cats.append(node.name)
+            node = node.parent
+        return cats[::-1]
+
+    def setHits(self, paths):
+        """
+        show only the parts in the list 'paths', in that order.
+        Pass None to go back to showing the whole tree
+        """
+        self.beginResetModel()
+        if paths is None:
+            self.hits = None
+            self.root.fetched = len(self.root.children)
+        else:
+            self.hits = [self.partNodes[x] for x in paths
+                         if x in self.partNodes]
+        self.endResetModel()
+
+    def nodeIndex(self, node):
+        if node is self.root:
+            return QtCore.QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def pathIndex(self, path):
+        """
+        index of the part 'path', fetching the rows above it if the
+        view hasn't been told about them yet. Returns an invalid index
+        if the part isn't on display
+        """
+        node = self.partNodes.get(path)
+        if node is None:
+            return QtCore.QModelIndex()
+        if self.hits is not None:
+            if node in self.hits:
+                return self.createIndex(self.hits.index(node), 0, node)
+            return QtCore.QModelIndex()
+        ancestors = []
+        while node is not self.root:
+            ancestors.append(node)
+            node = node.parent
+        for node in reversed(ancestors):
+            while node.row >= node.parent.fetched:
+                self.fetchMore(self.nodeIndex(node.parent))
+        return self.nodeIndex(ancestors[0])
+
+    def node(self, index):
+        if index.isValid():
+            return index.internalPointer()
+        return self.root
+
+    def partPath(self, index):
+        """
+        path to the file of the part at 'index', or None if
+        'index' isn't a part
+        """
+        if index.isValid():
+            return self.node(index).path
+        return None
+
+    # QAbstractItemModel interface
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if self.hits is not None:
+            if column != 0 or parent.isValid() or \
+                    not 0 <= row < len(self.hits):
+                return QtCore.QModelIndex()
+            return self.createIndex(row, 0, self.hits[row])
+        node = self.node(parent)
+        if column != 0 or node.children is None or \
+                not 0 <= row < node.fetched:
+            return QtCore.QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid() or self.hits is not None:
+            return QtCore.QModelIndex()
+        return self.nodeIndex(self.node(index).parent)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        if self.hits is not None:
+            return 0 if parent.isValid() else len(self.hits)
+        return self.node(parent).fetched
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QtCore.QModelIndex()):
+        if self.hits is not None:
+            return not parent.isValid()
+        return bool(self.node(parent).children)
+
+    def fetchable(self, node):
+        """
+        the number of children of 'node' the view may know about
+        """
+        return self.pending.get(node, len(node.children))
+
+    def canFetchMore(self, parent):
+        if self.hits is not None:
+            return False
+        node = self.node(parent)
+        return node.children is not None and \
+            node.fetched < self.fetchable(node)
+
+    def fetchMore(self, parent):
+        node = self.node(parent)
+        if node.children is None:
+            return
+        count = min(fetchChunkSize, self.fetchable(node) - node.fetched)
+        if count <= 0:
+            return
+        self.beginInsertRows(parent, node.fetched, node.fetched + count - 1)
+        node.fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = self.node(index)
+        if role == QtCore.Qt.DisplayRole:
+            return node.name
+        if role == QtCore.Qt.DecorationRole:
+            return self.folderIcon if node.path is None else self.partIcon
+        if role == QtCore.Qt.ToolTipRole:
+            return node.path
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
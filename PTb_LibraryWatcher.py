@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# follow changes made to the parts library folders while FreeCAD runs
+#
+
+import FreeCAD
+import os
+from PySide import QtCore
+from PTb_FCFileTools import packExtension
+from PTb_Library import getLibraryIndex
+
+# milliseconds to wait after the last change before the library is
+# reread, so that saving a document (which writes several files) is
+# only handled once
+debounceDelay = 500
+
+_watcher = None
+
+
+def getLibraryWatcher():
+    """
+    get the LibraryWatcher shared by everything in this session
+    """
+    global _watcher
+    if _watcher is None:
+        _watcher = LibraryWatcher(FreeCAD.Gui.getMainWindow())
+    return _watcher
+
+
+class _Refresher(QtCore.QObject):
+    """
+    refreshes library indexes on the watcher's background thread
+    """
+    # library folder, [(file path, index record)], [removed file paths]
+    refreshed = QtCore.Signal(str, object, object)
+
+    def refresh(self, requests):
+        """
+        requests is a list of (library folder, [document names]) pairs,
+        where None stands for the whole folder
+        """
+        for root, names in requests:
+            index = getLibraryIndex(root)
+            with index.lock:
+                try:
+                    added, changed, removed = index.refresh(names=names)
+                except OSError as e:
+                    FreeCAD.Console.PrintWarning(
+                        f"PartsToolbox: could not reread {root}: {e}\n")
+                    continue
+                updated = []
+                for name in added + changed:
+                    record = index.entries[name]
+                    # documents that became unreadable are dropped
+                    if "error" in record:
+                        removed.append(name)
+                    else:
+                        updated.append((index.path(name), record))
+            self.refreshed.emit(root, updated,
+                                [index.path(x) for x in removed])
+
+
+class LibraryWatcher(QtCore.QObject):
+    """
+    Watches parts library folders for documents being added, saved or
+    deleted.
+
+    The library folders are watched for documents coming and going,
+    and each document file (the .FCStd file, or the Document.xml of a
+    save-as-directory document) for edits made in place. Changes are
+    collected until none have come in for debounceDelay milliseconds,
+    then only the documents that may have changed are reread, on a
+    background thread. The outcome is announced through
+    documentsChanged
+    """
+    # library folder, [(file path, index record)], [removed file paths]
+    documentsChanged = QtCore.Signal(str, object, object)
+    _refreshRequested = QtCore.Signal(object)
+
+    def __init__(self, parent=None):
+        super(LibraryWatcher, self).__init__(parent)
+        self.roots = set()
+        # watched file -> (library folder, document name), where a
+        # name of None stands for the whole folder (for packs)
+        self.watchedFiles = {}
+        # library folder -> set of document names to reread, or None
+        # to reread the whole folder
+        self.pending = {}
+        self.fsWatcher = QtCore.QFileSystemWatcher(self)
+        self.fsWatcher.directoryChanged.connect(self._directoryChanged)
+        self.fsWatcher.fileChanged.connect(self._fileChanged)
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(debounceDelay)
+        self.timer.timeout.connect(self._flush)
+        self.workerThread = QtCore.QThread(self)
+        self.refresher = _Refresher()
+        self.refresher.moveToThread(self.workerThread)
+        self._refreshRequested.connect(self.refresher.refresh)
+        self.refresher.refreshed.connect(self._refreshed)
+        QtCore.QCoreApplication.instance().aboutToQuit.connect(self.stop)
+        self.workerThread.start()
+
+    def watch(self, root):
+        """
+        start following the library folder 'root'
+        """
+        root = os.path.normpath(os.path.abspath(root))
+        if root in self.roots or not os.path.isdir(root):
+            return
+        self.roots.add(root)
+        self.fsWatcher.addPath(root)
+        index = getLibraryIndex(root)
+        names = os.listdir(root)
+        self._watchFiles({os.path.join(root, x): (root, None)
+                          for x in names if x.endswith(packExtension)})
+        self._watchDocuments(root, [x for x in names if index.isDocument(x)])
+
+    def _watchDocuments(self, root, names):
+        files = {}
+        for name in names:
+            docPath = os.path.join(root, name)
+            if os.path.isdir(docPath):
+                docPath = os.path.join(docPath, "Document.xml")
+            files[docPath] = (root, name)
+        self._watchFiles(files)
+
+    def _watchFiles(self, files):
+        # files that are saved by replacing them drop out of the
+        # watcher, so they are added again after every change
+        files = {k: v for k, v in files.items() if os.path.isfile(k)}
+        self.watchedFiles.update(files)
+        if files:
+            self.fsWatcher.addPaths(list(files))
+
+    def stop(self):
+        self.timer.stop()
+        self.workerThread.quit()
+        self.workerThread.wait()
+
+    def _queue(self, root, name):
+        if name is None:
+            self.pending[root] = None
+        elif self.pending.get(root, set()) is not None:
+            self.pending.setdefault(root, set()).add(name)
+        self.timer.start()
+
+    def _directoryChanged(self, path):
+        if path in self.roots:
+            self._queue(path, None)
+
+    def _fileChanged(self, path):
+        if path in self.watchedFiles:
+            if os.path.isfile(path):
+                # replaced rather than written to
+                self.fsWatcher.addPath(path)
+            self._queue(*self.watchedFiles[path])
+
+    def _flush(self):
+        requests = [(root, None if names is None else sorted(names))
+                    for root, names in self.pending.items()]
+        self.pending = {}
+        if requests:
+            self._refreshRequested.emit(requests)
+
+    def _refreshed(self, root, updated, removed):
+        removed = set(removed)
+        for path, (fileRoot, name) in list(self.watchedFiles.items()):
+            if fileRoot == root and name is not None and \
+                    os.path.join(root, name) in removed:
+                del self.watchedFiles[path]
+        self._watchDocuments(root, [os.path.basename(x) for x, _ in updated
+                                    if os.path.dirname(x) == root])
+        self._watchFiles({os.path.join(root, x): (root, None)
+                          for x in os.listdir(root)
+                          if x.endswith(packExtension)})
+        # files that were replaced without changing anything
+        watched = set(self.fsWatcher.files())
+        self._watchFiles({k: v for k, v in self.watchedFiles.items()
+                          if v[0] == root and k not in watched})
+        if updated or removed:
+            self.documentsChanged.emit(root, updated, list(removed))
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# parts libraries packed into a single file.
+#
+# A pack is a zip archive whose first member, index.json, holds the
+# metadata of every document in it, as the library index would. It is
+# followed by the documents themselves: .FCStd files are stored as they
+# are, and the files of save-as-directory documents are compressed
+# one by one. Browsing a pack only reads the index, thumbnails are read
+# straight out of the archive, and documents are unpacked when they
+# are inserted into a project.
+# A pack is made with buildPack, the PartsToolbox_BuildPack macro, or,
+# with the FreeCAD lib folder on PYTHONPATH,
+#   python PTb_Pack.py LIBRARY_FOLDER PACK_FILE
+# and used by putting the pack file in a library folder
+#
+
+import FreeCAD
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import threading
+import zlib
+from zipfile import ZipFile, ZIP_DEFLATED, ZIP_STORED
+from PTb_FCFileTools import (packExtension, splitPackedPath,
+                             getLinkedFileNames)
+
+packIndexMember = "index.json"
+packVersion = 1
+# the layout of a zip local file header, up to the file name
+_localHeader = struct.Struct("<4s5H3L2H")
+
+# open packs by path, shared by everything in this session
+_readers = {}
+_readersLock = threading.Lock()
+
+
+def readPackIndex(packPath):
+    """
+    return the index stored at the front of a pack, without reading
+    the rest of the archive: only the first zip entry is looked at
+    """
+    with open(packPath, 'rb') as f:
+        header = f.read(_localHeader.size)
+        (signature, version, flags, method, modTime, modDate, crc,
+         compressedSize, size, nameLength, extraLength) = \
+            _localHeader.unpack(header)
+        if signature != b"PK\x03\x04":
+            raise ValueError(f"{packPath} is not a parts library pack")
+        name = f.read(nameLength).decode("utf-8")
+        if name != packIndexMember:
+            raise ValueError(f"{packPath} doesn't start with an index")
+        f.seek(extraLength, os.SEEK_CUR)
+        data = f.read(compressedSize)
+    if method == ZIP_DEFLATED:
+        data = zlib.decompress(data, -15)
+    index = json.loads(data.decode("utf-8"))
+    if index.get("version") != packVersion:
+        raise ValueError(f"{packPath} was made by another version "
+                         "of the parts toolbox")
+    for name in index["documents"]:
+        # names end up in file paths, they mustn't lead anywhere else
+        if name in ("", ".", "..") or "/" in name or "\\" in name or \
+                os.path.isabs(name):
+            raise ValueError(f"{packPath} has a document with the "
+                             f"unsafe name {name!r}")
+    return index
+
+
+def _containedPath(folder, *parts):
+    """
+    join parts of a path from a pack onto folder, making sure the result
+    stays inside folder
+    """
+    folder = os.path.abspath(folder)
+    path = os.path.normpath(os.path.join(folder, *parts))
+    if os.path.commonpath([folder, path]) != folder or path == folder:
+        raise ValueError(f"pack member {'/'.join(parts)!r} would be "
+                         f"written outside of {folder}")
+    return path
+
+
+class PackReader:
+    """
+    Random access to the documents in a pack. The pack file is kept
+    open, and reading a thumbnail only reads that one zip entry
+    """
+
+    def __init__(self, packPath):
+        self.path = packPath
+        self.stamp = packStamp(packPath)
+        self.index = readPackIndex(packPath)
+        self.zip = ZipFile(packPath, 'r')
+
+    def close(self):
+        self.zip.close()
+
+    def documents(self):
+        return self.index["documents"]
+
+    def readMember(self, name, member):
+        """
+        return the contents of the file 'member' (like 'Document.xml')
+        of the packed document 'name'
+        """
+        record = self.documents()[name]
+        if record["Format"] == "fcstd":
+            with self.zip.open(f"documents/{name}") as docFile:
+                with ZipFile(docFile, 'r') as zippedFCStd:
+                    return zippedFCStd.read(member)
+        return self.zip.read(f"documents/{name}/{member}")
+
+    def extract(self, name, destination):
+        """
+        write the packed document 'name' to the path 'destination'
+        """
+        record = self.documents()[name]
+        if record["Format"] == "fcstd":
+            with self.zip.open(f"documents/{name}") as src, \
+                    open(destination, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            return
+        prefix = f"documents/{name}/"
+        for info in self.zip.infolist():
+            if info.filename.startswith(prefix) and not info.is_dir():
+                path = _containedPath(
+                    destination, *info.filename[len(prefix):].split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with self.zip.open(info) as src, open(path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+
+
+def packStamp(packPath):
+    st = os.stat(packPath)
+    return (st.st_mtime_ns, st.st_size)
+
+
+def getPackReader(packPath):
+    """
+    get the (shared) PackReader of a pack, reopening it if the pack
+    file has changed
+    """
+    packPath = os.path.normpath(os.path.abspath(packPath))
+    with _readersLock:
+        reader = _readers.get(packPath)
+        if reader is None or reader.stamp != packStamp(packPath):
+            if reader is not None:
+                reader.close()
+            reader = _readers[packPath] = PackReader(packPath)
+        return reader
+
+
+def readPackedMember(docPath, member):
+    """
+    read one file of a packed document, by its path
+    ('library.ptbpack/document')
+    """
+    packPath, name = splitPackedPath(docPath)
+    return getPackReader(packPath).readMember(name, member)
+
+
+def packRecords(packPath):
+    """
+    return {document name: index record} for the documents in a pack.
+    The records carry the modification time and size of the pack
+    """
+    mtime, size = packStamp(packPath)
+    records = {}
+    for name, record in readPackIndex(packPath)["documents"].items():
+        record = dict(record, mtime=mtime, size=size)
+        records[name] = record
+    return records
+
+
+def getExtractedPath(packPath):
+    """
+    the folder packed documents of a pack are unpacked to. It changes
+    with the pack file, so an updated pack never mixes with an older one
+    """
+    mtime, size = packStamp(packPath)
+    return os.path.join(_extractedRoot(),
+                        f"{_packKey(packPath)}-{mtime}-{size}")
+
+
+def _extractedRoot():
+    return os.path.join(FreeCAD.getUserAppDataDir(), "PartsToolbox", "Packs")
+
+
+def _packKey(packPath):
+    return hashlib.sha1(os.path.abspath(packPath).encode()).hexdigest()
+
+
+def _pruneExtracted(packPath, keep):
+    """
+    remove the folders older versions of a pack were unpacked to
+    """
+    prefix = _packKey(packPath) + "-"
+    try:
+        names = os.listdir(_extractedRoot())
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(_extractedRoot(), name)
+        if name.startswith(prefix) and path != keep:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def extractDocument(docPath):
+    """
+    unpack a packed document, along with the packed documents it links
+    to, and return the path of the unpacked copy.
+    Documents are only unpacked once
+    """
+    packPath, name = splitPackedPath(docPath)
+    reader = getPackReader(packPath)
+    folder = getExtractedPath(packPath)
+    if not os.path.isdir(folder):
+        # the pack changed since it was last unpacked
+        _pruneExtracted(packPath, folder)
+        os.makedirs(folder, exist_ok=True)
+    todo = [name]
+    done = set()
+    while todo:
+        current = todo.pop()
+        if current in done:
+            continue
+        done.add(current)
+        target = _containedPath(folder, current)
+        if not os.path.exists(target):
+            # unpack next to the final location, then move it in place,
+            # so an interrupted unpack isn't mistaken for a complete one
+            tmpDir = tempfile.mkdtemp(dir=folder)
+            try:
+                reader.extract(current, os.path.join(tmpDir, current))
+                os.replace(os.path.join(tmpDir, current), target)
+            except OSError:
+                if not os.path.exists(target):
+                    raise
+            finally:
+                shutil.rmtree(tmpDir, ignore_errors=True)
+        # links are stored relative to the linking document, so
+        # linked documents from the same pack are unpacked next to it
+        xmlData = reader.readMember(current, "Document.xml")
+        for fileName in getLinkedFileNames(xmlData):
+            stem = fileName.removesuffix(".FCStd")
+            for candidate in (fileName, stem, stem + ".FCStd"):
+                if candidate in reader.documents():
+                    todo.append(candidate)
+                    break
+    return os.path.join(folder, name)
+
+
+def buildPack(libraryRoot, packPath):
+    """
+    pack all documents of the library folder 'libraryRoot' into the
+    file packPath. Documents that can't be read are left out.
+    Returns the number of documents packed
+    """
+    # imported here, PTb_Library needs this module for reading packs
+    from PTb_Library import LibraryIndex
+    index = LibraryIndex(os.path.normpath(os.path.abspath(libraryRoot)))
+    index.refresh()
+    documents = {}
+    for docPath, record in index.records():
+        if splitPackedPath(docPath):
+            continue
+        record = {k: v for k, v in record.items()
+                  if k not in ("mtime", "size")}
+        record["Format"] = "dir" if os.path.isdir(docPath) else "fcstd"
+        documents[os.path.basename(docPath)] = (docPath, record)
+    packIndex = {"version": packVersion,
+                 "documents": {k: v[1] for k, v in documents.items()}}
+    folder = os.path.dirname(os.path.abspath(packPath))
+    fd, tmpPath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    os.close(fd)
+    try:
+        with ZipFile(tmpPath, 'w', ZIP_DEFLATED, compresslevel=9) as pack:
+            # the index has to be the first entry, see readPackIndex
+            pack.writestr(packIndexMember, json.dumps(
+                packIndex, separators=(",", ":")))
+            for name, (docPath, record) in sorted(documents.items()):
+                if record["Format"] == "fcstd":
+                    # already compressed
+                    pack.write(docPath, f"documents/{name}",
+                               compress_type=ZIP_STORED)
+                    continue
+                for dirpath, dirnames, filenames in os.walk(docPath):
+                    dirnames.sort()
+                    for f in sorted(filenames):
+                        path = os.path.join(dirpath, f)
+                        member = os.path.relpath(path, docPath)
+                        pack.write(path, "/".join(
+                            ["documents", name] + member.split(os.sep)))
+        os.replace(tmpPath, packPath)
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+    for docPath, error in index.errors().items():
+        FreeCAD.Console.PrintWarning(
+            f"PartsToolbox: left {docPath} out of the pack: {error}\n")
+    FreeCAD.Console.PrintMessage(
+        f"PartsToolbox: packed {len(documents)} documents into {packPath}\n")
+    return len(documents)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3 or not sys.argv[2].endswith(packExtension):
+        sys.exit(f"usage: PTb_Pack.py LIBRARY_FOLDER PACK_FILE{packExtension}")
+    buildPack(sys.argv[1], sys.argv[2])
@@ -27,63 +27,254 @@
 import FreeCAD
 import os
 from PySide import QtGui, QtUiTools, QtCore
-from PTb_Base import UIPath, objpath
-from PTb_FCFileTools import getDataFromFCFile
+from PTb_Base import UIPath, objpath, UserParams
+from PTb_Library import getLibraryIndex
+from PTb_LibraryWatcher import getLibraryWatcher
+from PTb_FCFileTools import writeMetadata, splitPackedPath
+
+tablecolumns = ["File Name", "Type", "Id", "License", "LicenseURL"]
+# number of rows looked at to size the table columns
+columnSampleSize = 200
+
+
+class PartMetadataModel(QtCore.QAbstractTableModel):
+    """
+    Table of the metadata of library parts, one row per part.
+    Edits are kept in the model until they are saved, and rows that
+    differ from what is in the files are remembered, so only those
+    have to be written back
+    """
+
+    def __init__(self, records, parent=None):
+        super(PartMetadataModel, self).__init__(parent)
+        self.partIcon = FreeCAD.Gui.getIcon("PartsToolbox_Part")
+        # per row: [file path, file name, Type, Id, License, LicenseURL]
+        self.rows = [self.makeRow(path, record) for path, record in records]
+        self.original = [tuple(x) for x in self.rows]
+        # packed documents can't be edited in place
+        self.packed = {path for path, record in records
+                       if splitPackedPath(path)}
+        # numbers of the rows with unsaved edits
+        self.dirty = set()
+
+    def makeRow(self, path, record):
+        return [path, os.path.basename(path)] + \
+            [record[x] for x in tablecolumns[1:]]
+
+    def updateRecords(self, records, removed=()):
+        """
+        apply changes made to the library files: rows of removed parts
+        are dropped, rows of changed parts are updated unless they have
+        unsaved edits, and new parts are added at the end
+        """
+        rowNumbers = {row[0]: n for n, row in enumerate(self.rows)}
+        for n in sorted((rowNumbers[x] for x in removed if x in rowNumbers),
+                        reverse=True):
+            self.beginRemoveRows(QtCore.QModelIndex(), n, n)
+            self.packed.discard(self.rows[n][0])
+            del self.rows[n]
+            del self.original[n]
+            self.dirty = {x - (x > n) for x in self.dirty if x != n}
+            self.endRemoveRows()
+        rowNumbers = {row[0]: n for n, row in enumerate(self.rows)}
+        new = []
+        for path, record in records:
+            n = rowNumbers.get(path)
+            if n is None:
+                new.append(self.makeRow(path, record))
+            elif n not in self.dirty:
+                self.rows[n] = self.makeRow(path, record)
+                self.original[n] = tuple(self.rows[n])
+                self.dataChanged.emit(self.index(n, 0),
+                                      self.index(n, len(tablecolumns) - 1))
+        if new:
+            self.beginInsertRows(QtCore.QModelIndex(), len(self.rows),
+                                 len(self.rows) + len(new) - 1)
+            self.rows.extend(new)
+            self.original.extend(tuple(x) for x in new)
+            self.packed.update(x[0] for x in new if splitPackedPath(x[0]))
+            self.endInsertRows()
+
+    def libraryChanged(self, root, records, removed):
+        # for LibraryWatcher.documentsChanged
+        self.updateRecords(records, removed)
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        return 0 if parent.isValid() else len(tablecolumns)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and \
+                role == QtCore.Qt.DisplayRole:
+            return tablecolumns[section]
+        return None
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = self.rows[index.row()]
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole):
+            return row[index.column() + 1]
+        if index.column() == 0:
+            if role == QtCore.Qt.DecorationRole:
+                return self.partIcon
+            if role == QtCore.Qt.ToolTipRole:
+                return row[0]
+        if role == QtCore.Qt.FontRole and index.row() in self.dirty:
+            font = QtGui.QFont()
+            font.setBold(True)
+            return font
+        return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if role != QtCore.Qt.EditRole or not index.isValid() or \
+                index.column() == 0:
+            return False
+        n = index.row()
+        self.rows[n][index.column() + 1] = value
+        if tuple(self.rows[n]) == self.original[n]:
+            self.dirty.discard(n)
+        else:
+            self.dirty.add(n)
+        self.dataChanged.emit(self.index(n, 0),
+                              self.index(n, len(tablecolumns) - 1))
+        return True
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        # file names can't be edited
+        if index.column() == 0 or \
+                self.rows[index.row()][0] in self.packed:
+            return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable
+        return QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsSelectable | \
+            QtCore.Qt.ItemIsEditable
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        """
+        sort the rows by one column. done here rather than in the
+        proxy model, which would ask for every cell through data()
+        """
+        self.layoutAboutToBeChanged.emit()
+        oldIndexes = self.persistentIndexList()
+        newOrder = sorted(range(len(self.rows)),
+                          key=lambda n: self.rows[n][column + 1].lower(),
+                          reverse=(order == QtCore.Qt.DescendingOrder))
+        newNumbers = {old: new for new, old in enumerate(newOrder)}
+        self.rows = [self.rows[n] for n in newOrder]
+        self.original = [self.original[n] for n in newOrder]
+        self.dirty = {newNumbers[n] for n in self.dirty}
+        self.changePersistentIndexList(
+            oldIndexes, [self.index(newNumbers[x.row()], x.column())
+                         for x in oldIndexes])
+        self.layoutChanged.emit()
+
+    def searchText(self, row):
+        """
+        all text of a row in lower case, for filtering
+        """
+        return "\n".join(self.rows[row][1:]).lower()
+
+    def changes(self):
+        """
+        dict of file path -> {metadata field: new value} for every
+        part with unsaved edits
+        """
+        return {self.rows[n][0]: dict(zip(tablecolumns[1:], self.rows[n][2:]))
+                for n in sorted(self.dirty)}
+
+
+class PartMetadataFilter(QtCore.QSortFilterProxyModel):
+    """
+    shows the rows of a PartMetadataModel that contain some text in
+    any column. Sorting is left to the source model
+    """
+
+    def __init__(self, parent=None):
+        super(PartMetadataFilter, self).__init__(parent)
+        self.text = ""
+
+    def setFilterText(self, text):
+        self.text = text.lower()
+        self.invalidateFilter()
+
+    def filterAcceptsRow(self, sourceRow, sourceParent):
+        return not self.text or \
+            self.text in self.sourceModel().searchText(sourceRow)
+
+    def sort(self, column, order=QtCore.Qt.AscendingOrder):
+        self.sourceModel().sort(column, order)
+
+
+def libraryRoots():
+    """
+    the bundled parts library, and the users own parts folder if set
+    """
+    roots = [objpath]
+    userpath = UserParams.GetString("UserObjPath")
+    if userpath and os.path.isdir(userpath):
+        roots.append(userpath)
+    return roots
+
+
+def sampleColumnWidths(view, model, samples=columnSampleSize):
+    """
+    size the columns of 'view' to fit the text of a few rows spread
+    evenly over the table, instead of measuring every cell
+    """
+    metrics = view.fontMetrics()
+    rows = model.rowCount()
+    step = max(1, rows // samples)
+    # the file name column also has an icon
+    padding = [view.iconSize().width() + 24] + [16] * (len(tablecolumns) - 1)
+    for col in range(len(tablecolumns)):
+        width = metrics.horizontalAdvance(tablecolumns[col])
+        for row in range(0, rows, step):
+            width = max(width, metrics.horizontalAdvance(
+                model.index(row, col).data()))
+        view.setColumnWidth(col, min(width + padding[col], 500))
+
 
 def partMetaBrowser():
     """
     Open a Qt widget to browse and edit metadata fields of parts library parts
     """
-    PartIcon = FreeCAD.Gui.getIcon("PartsToolbox_Part")
     UIFilePath = os.path.join(UIPath, "PartMetaBrowser.ui")
     UI = QtUiTools.QUiLoader().load(UIFilePath)
-    files = os.listdir(objpath)
-    UI.tableWidget.setRowCount(0)
-    UI.tableWidget.setColumnCount(5)
-    header = UI.tableWidget.horizontalHeader()
-    header.setResizeMode(QtGui.QHeaderView.ResizeToContents)
-    header.setResizeMode(0, QtGui.QHeaderView.Stretch)
-    tablecolumns = ["File Name", "Type", "Id", "License", "LicenseURL"]
-    # keep a reference copy of all metadata as a nested list
-    datalist = {}
-    UI.tableWidget.setHorizontalHeaderLabels(tablecolumns)
-    for f in files:
-        itemData = getDataFromFCFile(os.path.join(objpath, f))
-        if itemData:
-            currentRow = UI.tableWidget.rowCount()
-            UI.tableWidget.setRowCount(UI.tableWidget.rowCount()+1)
-            fileNameItem = QtGui.QTableWidgetItem(PartIcon, f)
-            # set filename items to be non-editable
-            fileNameItem.setFlags(QtCore.Qt.ItemIsEnabled)
-            UI.tableWidget.setItem(currentRow, 0, fileNameItem)
-            datalist.update({f: {"Type": itemData["Type"], "Id": itemData["Id"],
-                            "License": itemData["License"], "LicenseURL": itemData["LicenseURL"]}})
-            for j, col in enumerate(tablecolumns[1:]):
-                item = QtGui.QTableWidgetItem(itemData[col])
-                UI.tableWidget.setItem(currentRow, j+1, item)
+    records = []
+    for root in libraryRoots():
+        index = getLibraryIndex(root)
+        index.refresh()
+        records.extend(index.records())
+    # same order as sorting by the file name column
+    records.sort(key=lambda x: os.path.basename(x[0]).lower())
+    model = PartMetadataModel(records, UI)
+    proxy = PartMetadataFilter(UI)
+    proxy.setSourceModel(model)
+    UI.filterEdit.textChanged.connect(proxy.setFilterText)
+    UI.tableView.setModel(proxy)
+    UI.tableView.horizontalHeader().setSortIndicator(
+        0, QtCore.Qt.AscendingOrder)
+    sampleColumnWidths(UI.tableView, model)
     UI.buttonBox.accepted.connect(
-        lambda: (updateMetadata(datalist, UI.tableWidget), UI.close()))
+        lambda: (updateMetadata(model), UI.close()))
+    # follow parts being added or edited while the table is open
+    watcher = getLibraryWatcher()
+    for root in libraryRoots():
+        watcher.watch(root)
+    watcher.documentsChanged.connect(model.libraryChanged)
+    UI.finished.connect(
+        lambda: watcher.documentsChanged.disconnect(model.libraryChanged))
     UI.show()
 
 
-def updateMetadata(oldData, tableWidget):
-    #tablecolumns = ["File Name", "Type", "ID", "License", "LicenseURL"]
-    newData = {}
-    for row in range(tableWidget.rowCount()):
-        filename = tableWidget.item(row, 0).text()
-        newData.update({filename: {
-            "Type": tableWidget.item(row, 1).text(),
-            "Id": tableWidget.item(row, 2).text(),
-            "License": tableWidget.item(row, 3).text(),
-            "LicenseURL": tableWidget.item(row, 4).text()
-        }})
-    for file in oldData.keys():
-        if oldData[file] != newData[file]:
-            FreeCAD.Console.PrintMessage(f"PartsToolbox: Update {file}\n")
-            doc = FreeCAD.openDocument(
-                os.path.join(objpath, file), hidden=True)
-            for key, val in newData[file].items():
-                setattr(doc.Part, key, val)
-            doc.recompute()
-            doc.save()
-            FreeCAD.closeDocument(doc.Name)
+def updateMetadata(model):
+    """
+    save the edited rows of a PartMetadataModel to their files
+    """
+    changes = model.changes()
+    for file in changes:
+        FreeCAD.Console.PrintMessage(f"PartsToolbox: Update {file}\n")
+    writeMetadata(changes)
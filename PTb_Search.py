@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# text search over the parts library
+#
+
+import bisect
+import heapq
+import re
+
+# how much a query term counts for, depending on how it matched
+exactScore = 3
+prefixScore = 2
+substringScore = 1
+# weight of a match, depending on the field it was found in
+fieldWeights = {"name": 3, "Id": 2, "Type": 1}
+
+_tokenPattern = re.compile(r"[0-9]+(?:\.[0-9]+)?|[^\W_]+(?:\.[0-9]+)?")
+
+
+def tokenize(text):
+    """
+    split text into lower case words and numbers. decimal numbers
+    stay in one piece, so 'M2.5' is a single token
+    """
+    return _tokenPattern.findall(text.lower())
+
+
+def trigrams(token):
+    return {token[i:i+3] for i in range(len(token) - 2)}
+
+
+class LibrarySearchIndex:
+    """
+    Inverted index over the file names, Type categories and Ids of
+    library parts.
+
+    Every query term is looked up as a whole token, as a token prefix
+    (by bisecting the sorted token list, for terms of two or more
+    characters) and, for terms of three or more characters, as a
+    substring of a token (through a trigram index).
+    A query never looks at parts that don't share a token or trigram
+    with it
+    """
+
+    def __init__(self):
+        # per part: (key, display name), or None once it is removed
+        self.parts = []
+        # key -> part number
+        self.numbers = {}
+        # part number -> tokens the part can be found by
+        self.partTokens = {}
+        # token -> {part number: best field weight}
+        self.postings = {}
+        # trigram -> set of tokens containing it
+        self.trigramTokens = {}
+        # all tokens, sorted. rebuilt lazily after adding parts
+        self._sortedTokens = None
+
+    def add(self, key, name, categories=(), partId=""):
+        """
+        make the part 'key' findable by its name, categories and Id.
+        Adding a key again replaces what it was found by
+        """
+        if key in self.numbers:
+            self.remove(key)
+        number = len(self.parts)
+        self.parts.append((key, name))
+        self.numbers[key] = number
+        tokens = self.partTokens[number] = set()
+        fields = [("name", name), ("Type", " ".join(categories))]
+        # the template for new parts uses '???' as a placeholder Id
+        if partId and partId != "???":
+            fields.append(("Id", partId))
+        for field, text in fields:
+            weight = fieldWeights[field]
+            for token in tokenize(text):
+                tokens.add(token)
+                posting = self.postings.get(token)
+                if posting is None:
+                    posting = self.postings[token] = {}
+                    self._sortedTokens = None
+                    for tri in trigrams(token):
+                        self.trigramTokens.setdefault(tri, set()).add(token)
+                if posting.get(number, 0) < weight:
+                    posting[number] = weight
+
+    def remove(self, key):
+        """
+        make the part 'key' unfindable. Tokens no other part has are
+        dropped from the index
+        """
+        number = self.numbers.pop(key, None)
+        if number is None:
+            return
+        self.parts[number] = None
+        for token in self.partTokens.pop(number):
+            posting = self.postings[token]
+            del posting[number]
+            if not posting:
+                del self.postings[token]
+                self._sortedTokens = None
+                for tri in trigrams(token):
+                    self.trigramTokens[tri].discard(token)
+
+    def _matchTerm(self, term):
+        """
+        return {part number: score} for a single query term
+        """
+        scores = {}
+
+        def collect(tokens, matchScore):
+            for token in tokens:
+                for number, weight in self.postings[token].items():
+                    score = matchScore * weight
+                    if scores.get(number, 0) < score:
+                        scores[number] = score
+
+        if term in self.postings:
+            collect([term], exactScore)
+        if len(term) < 2:
+            # a single letter is the prefix of half the library
+            return scores
+        if self._sortedTokens is None:
+            self._sortedTokens = sorted(self.postings)
+        start = bisect.bisect_right(self._sortedTokens, term)
+        end = bisect.bisect_left(self._sortedTokens, term + "\uffff")
+        prefixed = self._sortedTokens[start:end]
+        collect(prefixed, prefixScore)
+        if len(term) >= 3:
+            candidates = None
+            for tri in trigrams(term):
+                tokens = self.trigramTokens.get(tri, set())
+                candidates = tokens if candidates is None \
+                    else candidates & tokens
+                if not candidates:
+                    break
+            prefixed = set(prefixed)
+            collect([t for t in candidates or ()
+                     if term in t and t != term and t not in prefixed],
+                    substringScore)
+        return scores
+
+    def query(self, text, limit=None):
+        """
+        return the keys of the parts matching 'text', best match first.
+        Parts are ranked by the number of query terms they match, then
+        by how well they match. Only parts matching as many terms as
+        the best match are returned, so a term that matches nothing
+        doesn't hide everything else
+        """
+        terms = list(dict.fromkeys(tokenize(text)))
+        if not terms:
+            return []
+        matched = {}
+        total = {}
+        for term in terms:
+            for number, score in self._matchTerm(term).items():
+                matched[number] = matched.get(number, 0) + 1
+                total[number] = total.get(number, 0) + score
+        if not matched:
+            return []
+        best = max(matched.values())
+        hits = [n for n, count in matched.items() if count == best]
+        rank = lambda n: (-total[n], self.parts[n][1].lower())
+        if limit is not None and limit < len(hits):
+            hits = heapq.nsmallest(limit, hits, key=rank)
+        else:
+            hits.sort(key=rank)
+        return [self.parts[n][0] for n in hits]
@@ -0,0 +1,354 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# precomputed shapes of library parts, one per size configuration, so
+# that inserting a part doesn't have to rebuild its PartDesign body.
+# The cache is built with buildShapeCache (or the
+# PartsToolbox_BuildShapeCache macro) and used by insertParts when the
+# UseShapeCache preference is set
+#
+
+import FreeCAD
+import hashlib
+import itertools
+import json
+import os
+import re
+import tempfile
+from PTb_FCFileTools import (getDocumentStamp, splitPackedPath,
+                             getPartObject, configurationProperties)
+from PTb_Library import getLibraryIndex, hashDocument
+
+# the cache is stored in this folder in the root of each library folder
+shapeCacheFolderName = ".PartsToolboxShapes"
+# bump this whenever the layout of the cache manifests changes
+shapeCacheVersion = 1
+# past this many size combinations, each property is varied on its own
+maxConfigurations = 500
+# features that model threads, and are left out of simplified shapes
+threadFeatureTypes = ("PartDesign::AdditiveHelix",
+                      "PartDesign::SubtractiveHelix")
+# names of the files in the cache: shapes and manifests
+_cacheFilePattern = re.compile(
+    r"([0-9a-f]{40})(?:-[0-9]+(?:-simplified)?\.brep|\.json)$")
+
+
+def cacheFolders(root):
+    """
+    possible locations of the shape cache of the library folder 'root',
+    in order of preference
+    """
+    fallbackName = hashlib.sha1(root.encode()).hexdigest()
+    return [
+        os.path.join(root, shapeCacheFolderName),
+        os.path.join(FreeCAD.getUserAppDataDir(), "PartsToolbox",
+                     "Shapes", fallbackName),
+    ]
+
+
+def libraryRoot(docPath):
+    """
+    return the library folder a document is in, and the name the
+    library index knows it by
+    """
+    packed = splitPackedPath(docPath)
+    root = os.path.dirname(packed[0] if packed else docPath)
+    return root, docPath[len(root):].lstrip("/\\")
+
+
+def documentHash(docPath):
+    """
+    content hash of a library document, taken from the library index
+    when it is up to date. None if it can't be known
+    """
+    root, name = libraryRoot(docPath)
+    record = getLibraryIndex(root).entries.get(name)
+    try:
+        if record and "hash" in record and \
+                (record["mtime"], record["size"]) == getDocumentStamp(docPath):
+            return record["hash"]
+        if splitPackedPath(docPath):
+            return None
+        return hashDocument(docPath)
+    except OSError:
+        return None
+
+
+def manifestName(docHash):
+    return f"{docHash}.json"
+
+
+def loadManifest(docPath):
+    """
+    return (cache folder, manifest) for the current version of a
+    document, or None if no shapes were cached for it
+    """
+    docHash = documentHash(docPath)
+    if docHash is None:
+        return None
+    for folder in cacheFolders(libraryRoot(docPath)[0]):
+        try:
+            with open(os.path.join(folder, manifestName(docHash)), 'r',
+                      encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if manifest.get("version") == shapeCacheVersion:
+            return folder, manifest
+    return None
+
+
+def configurationKey(configuration):
+    """
+    the text a {property: value} configuration is stored under
+    """
+    return ";".join(f"{prop}={value}"
+                    for prop, value in sorted(configuration.items()))
+
+
+def resolveSize(manifest, size):
+    """
+    the configuration chosen by a size (see setPartSize), starting
+    from the default configuration of the part. None if the part
+    doesn't come in that size
+    """
+    configuration = dict(manifest["defaults"])
+    for setting in (size or "").split(";"):
+        setting = setting.strip()
+        if not setting:
+            continue
+        if "=" in setting:
+            prop, value = (x.strip() for x in setting.split("=", 1))
+        else:
+            value = setting
+            prop = next((x for x, values in manifest["properties"].items()
+                         if value in values), None)
+        if value not in manifest["properties"].get(prop, ()):
+            return None
+        configuration[prop] = value
+    return configuration
+
+
+def findCachedShape(docPath, size=None, simplified=False):
+    """
+    look up the cached shape of a part in a given size. Returns a
+    (brep file path, label) pair, or None if it isn't cached.
+    With 'simplified', the shape without modeled threads is preferred
+    """
+    found = loadManifest(docPath)
+    if found is None:
+        return None
+    folder, manifest = found
+    configuration = resolveSize(manifest, size)
+    if configuration is None:
+        return None
+    entry = manifest["shapes"].get(configurationKey(configuration))
+    if entry is None:
+        return None
+    shapeFile = entry.get("simplified") if simplified else None
+    return os.path.join(folder, shapeFile or entry["full"]), entry["Label"]
+
+
+def addCachedShape(doc, docPath, shapeFile, label, size, shapes):
+    """
+    add a plain Part::Feature holding a cached shape to doc.
+    'shapes' maps brep files to shapes that were already loaded, so
+    repeated parts share one read of the file.
+    Returns the new object
+    """
+    import Part
+    shape = shapes.get(shapeFile)
+    if shape is None:
+        shape = shapes[shapeFile] = Part.Shape()
+        shape.importBrep(shapeFile)
+    obj = doc.addObject("Part::Feature", "ToolboxPart")
+    obj.Shape = shape
+    obj.Label = label
+    # remember where the shape came from, since there's no link to it
+    obj.addProperty("App::PropertyString", "ToolboxSource", "PartsToolbox",
+                    "library document this shape was made from")
+    obj.ToolboxSource = os.path.basename(docPath)
+    obj.addProperty("App::PropertyString", "ToolboxSize", "PartsToolbox",
+                    "size the shape was made in")
+    obj.ToolboxSize = size or ""
+    return obj
+
+
+def configurations(obj, props):
+    """
+    every combination of the values of 'props', or if there are too
+    many, every value of each property with the others at their default
+    """
+    values = [obj.getEnumerationsOfProperty(x) for x in props]
+    count = 1
+    for x in values:
+        count *= len(x)
+    if count <= maxConfigurations:
+        return [dict(zip(props, combination))
+                for combination in itertools.product(*values)]
+    FreeCAD.Console.PrintWarning(
+        f"PartsToolbox: {obj.Document.Name} has {count} sizes, only "
+        "caching one property at a time\n")
+    defaults = {x: getattr(obj, x) for x in props}
+    return [dict(defaults, **{prop: value})
+            for prop, propValues in zip(props, values)
+            for value in propValues]
+
+
+def threadSettings(doc):
+    """
+    the property settings that leave modeled threads out of a document,
+    as (object, property, value) tuples. Helix features are suppressed
+    where FreeCAD supports it, holes stop modeling their thread
+    """
+    settings = []
+    for obj in doc.Objects:
+        if obj.TypeId in threadFeatureTypes and \
+                "Suppressed" in obj.PropertiesList:
+            settings.append((obj, "Suppressed", True))
+        elif obj.TypeId == "PartDesign::Hole" and \
+                "ModelThread" in obj.PropertiesList and obj.ModelThread:
+            settings.append((obj, "ModelThread", False))
+    return settings
+
+
+def _exportShape(shape, folder, fileName):
+    fd, tmpPath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    os.close(fd)
+    try:
+        shape.exportBrep(tmpPath)
+        os.replace(tmpPath, os.path.join(folder, fileName))
+    except BaseException:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+        raise
+
+
+def cacheDocumentShapes(docPath, folder):
+    """
+    compute and save the shape of a library part in each of its sizes,
+    with and without modeled threads. Returns the manifest written.
+    Building changes the sizes of the part, so a document that is
+    already open (and may be being edited) is left alone
+    """
+    import Part
+    docHash = documentHash(docPath)
+    if docHash is None:
+        # the cache files are named after it
+        raise ValueError("its contents can't be read")
+    if splitPackedPath(docPath):
+        from PTb_Pack import extractDocument
+        docPath = extractDocument(docPath)
+    docPath = os.path.normpath(os.path.abspath(docPath))
+    if any(os.path.normpath(x.FileName) == docPath
+           for x in FreeCAD.listDocuments().values()):
+        raise ValueError("it is open in FreeCAD, close it first")
+    doc = FreeCAD.openDocument(docPath, hidden=True)
+    try:
+        top = getPartObject(doc)
+        if top is None:
+            raise ValueError("no Part or Body object")
+        props = configurationProperties(top)
+        defaults = {x: getattr(top, x) for x in props}
+        manifest = {
+            "version": shapeCacheVersion,
+            "properties": {x: top.getEnumerationsOfProperty(x)
+                           for x in props},
+            "defaults": defaults,
+            "shapes": {},
+        }
+        threads = threadSettings(doc)
+        for number, configuration in enumerate(
+                configurations(top, props) if props else [{}]):
+            for prop, value in configuration.items():
+                setattr(top, prop, value)
+            doc.recompute()
+            entry = {"Label": top.Label, "full": f"{docHash}-{number}.brep"}
+            _exportShape(Part.getShape(top), folder, entry["full"])
+            if threads:
+                old = [(obj, prop, getattr(obj, prop))
+                       for obj, prop, _ in threads]
+                for obj, prop, value in threads:
+                    setattr(obj, prop, value)
+                doc.recompute()
+                entry["simplified"] = f"{docHash}-{number}-simplified.brep"
+                _exportShape(Part.getShape(top), folder, entry["simplified"])
+                for obj, prop, value in old:
+                    setattr(obj, prop, value)
+            manifest["shapes"][configurationKey(configuration)] = entry
+    finally:
+        FreeCAD.closeDocument(doc.Name)
+    # the manifest goes last, so a half built cache is never used
+    fd, tmpPath = tempfile.mkstemp(dir=folder, suffix=".tmp")
+    with os.fdopen(fd, 'w', encoding="utf-8") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(tmpPath, os.path.join(folder, manifestName(docHash)))
+    return manifest
+
+
+def buildShapeCache(root):
+    """
+    cache the shapes of every part in the library folder 'root'.
+    Parts that are already cached in their current version are
+    skipped. Returns the number of parts cached
+    """
+    root = os.path.normpath(os.path.abspath(root))
+    index = getLibraryIndex(root)
+    index.refresh()
+    for folder in cacheFolders(root):
+        try:
+            os.makedirs(folder, exist_ok=True)
+            tempfile.TemporaryFile(dir=folder).close()
+            break
+        except OSError:
+            continue
+    else:
+        FreeCAD.Console.PrintError(
+            f"PartsToolbox: nowhere to save the shape cache of {root}\n")
+        return 0
+    count = 0
+    records = index.records()
+    for docPath, record in records:
+        if loadManifest(docPath) is not None:
+            continue
+        try:
+            cacheDocumentShapes(docPath, folder)
+        except Exception as e:
+            FreeCAD.Console.PrintWarning(
+                f"PartsToolbox: could not cache the shapes of {docPath}: "
+                f"{e}\n")
+            continue
+        count += 1
+    # drop the shapes of documents that changed or are gone. Only files
+    # named like the cache's own are touched
+    current = {record["hash"] for _, record in records}
+    for fileName in os.listdir(folder):
+        match = _cacheFilePattern.match(fileName)
+        if match and match.group(1) not in current:
+            try:
+                os.remove(os.path.join(folder, fileName))
+            except OSError:
+                pass
+    FreeCAD.Console.PrintMessage(
+        f"PartsToolbox: cached the shapes of {count} parts of {root}\n")
+    return count
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# load, shrink and cache the thumbnail images of library parts
+#
+
+import FreeCAD
+import glob
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+from zipfile import ZipFile
+from PySide import QtCore, QtGui
+from PTb_FCFileTools import splitPackedPath
+from PTb_Library import getDocumentStamp, thumbnailMember
+from PTb_Pack import readPackedMember
+
+
+def readThumbnail(docPath):
+    """
+    return the raw thumbnail image stored in a FreeCAD document, or
+    None if it has none. Handles directory, .FCStd and packed documents
+    """
+    try:
+        if splitPackedPath(docPath):
+            return readPackedMember(docPath, thumbnailMember)
+        if os.path.isdir(docPath):
+            with open(os.path.join(docPath, thumbnailMember), 'rb') as f:
+                return f.read()
+        with ZipFile(docPath, 'r') as zippedFCStd:
+            return zippedFCStd.read(thumbnailMember)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class _ThumbnailJob(QtCore.QRunnable):
+    """
+    loads one thumbnail on a thread pool thread
+    """
+
+    def __init__(self, cache, docPath, stamp):
+        super(_ThumbnailJob, self).__init__()
+        self.cache = cache
+        self.docPath = docPath
+        self.stamp = stamp
+
+    def run(self):
+        image = self.cache.loadImage(self.docPath, self.stamp)
+        self.cache.imageLoaded.emit((self.docPath, self.stamp), image)
+
+
+class ThumbnailCache(QtCore.QObject):
+    """
+    Thumbnails of library parts, scaled down to fit the preview.
+
+    Scaled images are saved to a cache folder, named after the document
+    and its (modification time, size) stamp, so each document is only
+    decoded once until it changes. The most recently used previews are
+    also kept in memory as ready to draw QPixmaps, by document and stamp.
+    The stamp is normally the one in the library index, so a document
+    that changed never shows its old preview.
+    QPixmaps can only be made on the GUI thread, so images loaded in
+    the background are handed over through the imageLoaded signal
+    """
+    # (document path, stamp), scaled image
+    imageLoaded = QtCore.Signal(object, QtGui.QImage)
+
+    def __init__(self, size=200, capacity=256, parent=None):
+        super(ThumbnailCache, self).__init__(parent)
+        self.size = size
+        self.capacity = capacity
+        self.pixmaps = OrderedDict()
+        self.pending = set()
+        self.cacheDir = os.path.join(
+            FreeCAD.getUserAppDataDir(), "PartsToolbox", "Thumbnails")
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.imageLoaded.connect(self._store)
+
+    def cachePath(self, docPath, stamp):
+        """
+        file name of the cached preview of one version of a document
+        """
+        fileName = f"{self.stampPrefix(docPath, stamp)}{self.size}.png"
+        return os.path.join(self.cacheDir, fileName)
+
+    def cacheKey(self, docPath):
+        return hashlib.sha1(docPath.encode()).hexdigest()
+
+    def stampPrefix(self, docPath, stamp):
+        # shared by the previews of one version, whatever their size
+        mtime, size = stamp
+        return f"{self.cacheKey(docPath)}-{mtime}-{size}-"
+
+    def currentStamp(self, docPath):
+        """
+        the stamp of a document as it is on disk, or None if it is gone
+        """
+        try:
+            return getDocumentStamp(docPath)
+        except OSError:
+            return None
+
+    def loadImage(self, docPath, stamp=None):
+        """
+        return the scaled thumbnail of the version 'stamp' of a document
+        (by default the one on disk) as a QImage, from the cache folder
+        if possible. Safe to call from any thread.
+        Returns a null image if the document has no thumbnail
+        """
+        if stamp is None:
+            stamp = self.currentStamp(docPath)
+            if stamp is None:
+                return QtGui.QImage()
+        cached = self.cachePath(docPath, stamp)
+        if os.path.isfile(cached):
+            return QtGui.QImage(cached)
+        data = readThumbnail(docPath)
+        image = QtGui.QImage()
+        if not data or not image.loadFromData(data):
+            return QtGui.QImage()
+        if image.width() > self.size or image.height() > self.size:
+            image = image.scaled(self.size, self.size,
+                                 QtCore.Qt.KeepAspectRatio,
+                                 QtCore.Qt.SmoothTransformation)
+        self._saveToCache(docPath, stamp, cached, image)
+        return image
+
+    def _saveToCache(self, docPath, stamp, cached, image):
+        current = self.stampPrefix(docPath, stamp)
+        # drop previews of other versions of the same document. previews
+        # of this version may be being read by another thread, they stay
+        for old in glob.glob(os.path.join(
+                self.cacheDir, self.cacheKey(docPath) + "-*.png")):
+            if not os.path.basename(old).startswith(current):
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+        try:
+            os.makedirs(self.cacheDir, exist_ok=True)
+            fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix=".png")
+            os.close(fd)
+            if image.save(tmpPath, "PNG"):
+                os.replace(tmpPath, cached)
+            else:
+                os.remove(tmpPath)
+        except OSError:
+            pass
+
+    def pixmap(self, docPath, stamp=None):
+        """
+        return the preview of the version 'stamp' of a document (by
+        default the one on disk) as a QPixmap. a null pixmap means there
+        is no thumbnail
+        """
+        if stamp is None:
+            stamp = self.currentStamp(docPath)
+            if stamp is None:
+                return QtGui.QPixmap()
+        key = (docPath, tuple(stamp))
+        if key in self.pixmaps:
+            self.pixmaps.move_to_end(key)
+            return self.pixmaps[key]
+        return self._store(key, self.loadImage(docPath, stamp))
+
+    def forget(self, docPath):
+        """
+        drop the previews of a document from memory, after it changed
+        """
+        for key in [x for x in self.pixmaps if x[0] == docPath]:
+            del self.pixmaps[key]
+
+    def prefetch(self, parts):
+        """
+        load the previews of 'parts', a list of (document path, stamp)
+        tuples, in the background, so that they are in memory when they
+        are asked for
+        """
+        for docPath, stamp in parts[:self.capacity // 2]:
+            if stamp is None:
+                stamp = self.currentStamp(docPath)
+                if stamp is None:
+                    continue
+            key = (docPath, tuple(stamp))
+            if key in self.pixmaps or key in self.pending:
+                continue
+            self.pending.add(key)
+            self.pool.start(_ThumbnailJob(self, docPath, key[1]))
+
+    def _store(self, key, image):
+        self.pending.discard(key)
+        pixmap = QtGui.QPixmap.fromImage(image)
+        self.pixmaps[key] = pixmap
+        self.pixmaps.move_to_end(key)
+        while len(self.pixmaps) > self.capacity:
+            self.pixmaps.popitem(last=False)
+        return pixmap
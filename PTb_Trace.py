@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# opt-in timing of the slow parts of the toolbox, for finding out
+# where the time goes when something feels slow
+#
+
+import FreeCAD
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from PTb_Base import UserParams
+
+# the session each thread is recording into, if any
+_local = threading.local()
+
+
+def enabled():
+    """
+    is profiling turned on in the preferences?
+    """
+    return UserParams.GetBool("EnableProfiling")
+
+
+def _timestamp(seconds):
+    # trace files count in microseconds
+    return round(seconds * 1e6, 1)
+
+
+class Session:
+    """
+    Everything recorded for one session, such as a library scan or an
+    insert. A session belongs to the thread that began it, so sessions
+    of other threads don't mix with it. Work done for it in another
+    thread is recorded with attach()
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.counters = {}
+        # names and start times of the nested sessions still open
+        self.nested = []
+        self.ended = False
+
+    def addEvent(self, event):
+        with self.lock:
+            if not self.ended:
+                self.events.append(event)
+
+    def addCount(self, name, amount):
+        with self.lock:
+            if self.ended:
+                return
+            self.counters[name] = self.counters.get(name, 0) + amount
+            self.events.append({"name": name, "cat": "PartsToolbox",
+                                "ph": "C",
+                                "ts": _timestamp(time.perf_counter()),
+                                "pid": os.getpid(),
+                                "args": {"value": self.counters[name]}})
+
+    def end(self):
+        """
+        stop recording, print a summary to the Report view and write a
+        trace file. Ending a session twice does nothing
+        """
+        end = time.perf_counter()
+        with self.lock:
+            if self.ended:
+                return
+            self.ended = True
+            self.events.append(
+                _completeEvent(self.name, self.start, end, {}))
+            events = list(self.events)
+            counters = dict(self.counters)
+        report(self.name, end - self.start, events, counters)
+
+
+def newSession(name):
+    """
+    start a session that isn't recorded into until it is attached to a
+    thread. Returns None unless profiling is turned on
+    """
+    if not enabled():
+        return None
+    return Session(name)
+
+
+def currentSession():
+    return getattr(_local, "session", None)
+
+
+@contextmanager
+def attach(session):
+    """
+    record what this thread does in the with block into 'session'
+    (which may be None), like the worker thread of a library scan does
+    """
+    previous = currentSession()
+    _local.session = session
+    try:
+        yield session
+    finally:
+        _local.session = previous
+
+
+def beginSession(name):
+    """
+    start recording a session of this thread. Sessions can be nested,
+    everything is reported when the outermost one ends. Does nothing
+    unless profiling is turned on
+    """
+    current = currentSession()
+    if current is None:
+        _local.session = newSession(name)
+    elif not current.ended:
+        current.nested.append((name, time.perf_counter()))
+
+
+def endSession():
+    """
+    end the session this thread began last. Ending the outermost session
+    prints a summary to the Report view and writes a trace file
+    """
+    current = currentSession()
+    if current is None:
+        return
+    if current.nested:
+        name, start = current.nested.pop()
+        current.addEvent(
+            _completeEvent(name, start, time.perf_counter(), {}))
+        return
+    _local.session = None
+    current.end()
+
+
+@contextmanager
+def session(name):
+    beginSession(name)
+    try:
+        yield
+    finally:
+        endSession()
+
+
+def _completeEvent(name, start, end, args):
+    return {"name": name, "cat": "PartsToolbox", "ph": "X",
+            "ts": _timestamp(start), "dur": _timestamp(end - start),
+            "pid": os.getpid(), "tid": threading.get_ident(),
+            "args": args}
+
+
+@contextmanager
+def stage(name, **args):
+    """
+    time the code in a with block as one stage of this threads session.
+    'args' are saved in the trace along with the timing
+    """
+    current = currentSession()
+    if current is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.addEvent(
+            _completeEvent(name, start, time.perf_counter(), args))
+
+
+def count(name, amount=1):
+    """
+    add to a counter of this threads session, like the number of
+    bytes copied
+    """
+    current = currentSession()
+    if current is not None:
+        current.addCount(name, amount)
+
+
+def report(name, duration, events, counters):
+    """
+    print the time spent per stage, and save the events as a trace
+    file that chrome://tracing or Perfetto can open
+    """
+    totals = {}
+    for event in events:
+        if event["ph"] == "X" and event["name"] != name:
+            calls, total = totals.get(event["name"], (0, 0.0))
+            totals[event["name"]] = (calls + 1, total + event["dur"] / 1000)
+    lines = [f"PartsToolbox profile of {name}: {duration * 1000:.1f} ms"]
+    for stageName, (calls, total) in sorted(
+            totals.items(), key=lambda x: -x[1][1]):
+        lines.append(f"  {stageName}: {total:.1f} ms in {calls} "
+                     f"call{'s' if calls != 1 else ''}")
+    for counter, value in sorted(counters.items()):
+        lines.append(f"  {counter}: {value}")
+    FreeCAD.Console.PrintMessage("\n".join(lines) + "\n")
+    traceDir = UserParams.GetString("TracePath")
+    if not traceDir:
+        return
+    fileName = "PartsToolbox-{}-{}.json".format(
+        re.sub(r"\W+", "_", name).strip("_"),
+        time.strftime("%Y%m%d-%H%M%S"))
+    tracePath = os.path.join(traceDir, fileName)
+    try:
+        os.makedirs(traceDir, exist_ok=True)
+        with open(tracePath, 'w', encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+    except OSError as e:
+        FreeCAD.Console.PrintWarning(
+            f"PartsToolbox: could not write trace file {tracePath}: {e}\n")
+        return
+    FreeCAD.Console.PrintMessage(f"PartsToolbox: trace saved to {tracePath}\n")
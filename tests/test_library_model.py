@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# check the browser tree model against Qt's QAbstractItemModelTester,
+# which catches rows the view is told about twice or not at all.
+# Uses the FreeCAD stand-in in Benchmark/stubs, so it runs in plain
+# python with PySide2 or PySide6:
+#   python -m unittest discover tests
+#
+
+import os
+import sys
+import unittest
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(_here), "Benchmark", "stubs"))
+sys.path.insert(0, os.path.dirname(_here))
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+try:
+    from PySide import QtCore, QtGui
+    try:
+        from PySide6.QtTest import QAbstractItemModelTester
+    except ImportError:
+        from PySide2.QtTest import QAbstractItemModelTester
+except ImportError:
+    QAbstractItemModelTester = None
+
+
+def parts(names, cats):
+    return [(f"/library/{name}.FCStd", cats, {}) for name in names]
+
+
+@unittest.skipIf(QAbstractItemModelTester is None, "needs PySide with QtTest")
+class PartLibraryModelTest(unittest.TestCase):
+
+    def setUp(self):
+        from PTb_LibraryModel import PartLibraryModel
+        self.app = QtGui.QApplication.instance() or QtGui.QApplication([])
+        # the tester reports problems as Qt warnings
+        self.failures = []
+        QtCore.qInstallMessageHandler(
+            lambda kind, context, message: self.failures.append(message))
+        self.model = PartLibraryModel()
+        self.tester = QAbstractItemModelTester(
+            self.model,
+            QAbstractItemModelTester.FailureReportingMode.Warning)
+        # the tester fetches every category it walks through, like an
+        # expanded view would
+        self.model.addParts(parts(["a", "b", "c"], ["Screws", "ISO"]))
+
+    def tearDown(self):
+        QtCore.qInstallMessageHandler(None)
+        self.assertEqual(self.failures, [])
+
+    def test_add(self):
+        self.model.addParts(parts(["d", "e", "f"], ["Screws", "ISO"]))
+        self.model.addParts(parts(["g"], ["Nuts"]))
+        self.assertEqual(self.model.rowCount(), 2)
+        screws = self.model.index(0, 0)
+        iso = self.model.index(0, 0, screws)
+        self.assertEqual(self.model.rowCount(iso), 6)
+
+    def test_update(self):
+        self.model.updateParts(parts(["a"], ["Screws", "DIN"]) +
+                               parts(["h", "i"], ["Screws", "ISO"]))
+        screws = self.model.index(0, 0)
+        self.assertEqual(self.model.rowCount(screws), 2)
+        self.assertEqual(self.model.partCategories("/library/a.FCStd"),
+                         ["Screws", "DIN"])
+
+    def test_remove(self):
+        self.model.removeParts(["/library/a.FCStd", "/library/b.FCStd",
+                                "/library/c.FCStd"])
+        self.assertEqual(self.model.rowCount(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
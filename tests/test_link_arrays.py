@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+# ***************************************************************************
+# *                                                                         *
+# *   Copyright (c) 2021 Alex Neufeld <alex.d.neufeld@gmail.com>            *
+# *                                                                         *
+# *   This program is free software; you can redistribute it and/or modify  *
+# *   it under the terms of the GNU Lesser General Public License (LGPL)    *
+# *   as published by the Free Software Foundation; either version 2 of     *
+# *   the License, or (at your option) any later version.                   *
+# *   for detail see the LICENCE text file.                                 *
+# *                                                                         *
+# *   This program is distributed in the hope that it will be useful,       *
+# *   but WITHOUT ANY WARRANTY; without even the implied warranty of        *
+# *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the         *
+# *   GNU Library General Public License for more details.                  *
+# *                                                                         *
+# *   You should have received a copy of the GNU Library General Public     *
+# *   License along with this program; if not, write to the Free Software   *
+# *   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  *
+# *   USA                                                                   *
+# *                                                                         *
+# ***************************************************************************
+#
+# check that parts inserted as link arrays (import mode 3) end up in
+# one array per part and size, also after FreeCAD copied a sized part
+# into the project (LinkCopyOnChange). FreeCAD documents are played by
+# small stand-ins, so this runs in plain python:
+#   python -m unittest discover tests
+#
+
+import os
+import sys
+import unittest
+
+_here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(os.path.dirname(_here), "Benchmark", "stubs"))
+sys.path.insert(0, os.path.dirname(_here))
+
+from PTb_FCFileTools import (addLinkArrayElement,  # noqa: E402
+                             mergeDuplicateParts)
+
+sizes = ["M3", "M4", "M5"]
+
+
+class FakeObject:
+    """
+    a part object with one size property, Diameter
+    """
+
+    def __init__(self, doc, name, typeId="Part::FeaturePython"):
+        self.Document = doc
+        self.Name = name
+        self.Label = name
+        self.TypeId = typeId
+        self.Diameter = sizes[0]
+        self.InList = []
+
+    @property
+    def PropertiesList(self):
+        return ["Label", "Diameter"]
+
+    def getTypeIdOfProperty(self, prop):
+        if prop == "Diameter":
+            return "App::PropertyEnumeration"
+        return "App::PropertyString"
+
+    def getPropertyStatus(self, prop):
+        return ["CopyOnChange"] if prop == "Diameter" else []
+
+    def getEnumerationsOfProperty(self, prop):
+        return sizes
+
+    def getExpression(self, prop):
+        return None
+
+    def getParentGroup(self):
+        return None
+
+
+class FakeLink(FakeObject):
+    """
+    an App::Link. Setting its size copies the linked part into the
+    document of the link, as LinkCopyOnChange does
+    """
+
+    def __init__(self, doc, name):
+        super().__init__(doc, name, "App::Link")
+        self.__dict__["LinkedObject"] = None
+        self.LinkCopyOnChangeSource = None
+        self.ElementCount = 0
+        self.PlacementList = []
+        self.Placement = None
+
+    def __setattr__(self, prop, value):
+        super().__setattr__(prop, value)
+        if prop == "LinkedObject":
+            self.__dict__["Diameter"] = value.Diameter
+        elif prop == "Diameter" and self.__dict__.get("LinkedObject") \
+                and self.__dict__.get("LinkCopyOnChangeSource") is None:
+            copy = self.Document.addObject("Part::FeaturePython",
+                                           self.LinkedObject.Name)
+            copy.Diameter = value
+            self.__dict__["LinkCopyOnChangeSource"] = self.LinkedObject
+            self.__dict__["LinkedObject"] = copy
+
+
+class FakeDocument:
+
+    def __init__(self, fileName):
+        self.FileName = fileName
+        self.Name = os.path.basename(fileName).split(".")[0]
+        self.Objects = []
+
+    def addObject(self, typeId, name=None):
+        name = name or typeId.split("::")[-1]
+        names = {x.Name for x in self.Objects}
+        unique, n = name, 0
+        while unique in names:
+            n += 1
+            unique = f"{name}{n:03d}"
+        if typeId == "App::Link":
+            obj = FakeLink(self, unique)
+        else:
+            obj = FakeObject(self, unique, typeId)
+        self.Objects.append(obj)
+        return obj
+
+    def removeObject(self, name):
+        self.Objects = [x for x in self.Objects if x.Name != name]
+
+    def openTransaction(self, name):
+        pass
+
+    def commitTransaction(self):
+        pass
+
+    def abortTransaction(self):
+        pass
+
+    def recompute(self, objects=None):
+        pass
+
+
+class LinkArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.project = FakeDocument("/project/assembly.FCStd")
+        self.partDoc = FakeDocument("/project/ToolboxParts/Screw.FCStd")
+        self.part = self.partDoc.addObject("Part::FeaturePython", "Part")
+
+    def arrays(self):
+        return [x for x in self.project.Objects if x.TypeId == "App::Link"]
+
+    def test_same_size(self):
+        # a fresh 'arrays' each time, as for separate inserts
+        for n in range(3):
+            addLinkArrayElement(self.project, self.part, "M4", f"p{n}")
+        arrays = self.arrays()
+        self.assertEqual(len(arrays), 1)
+        self.assertIsNot(arrays[0].LinkedObject, self.part)
+        self.assertEqual(arrays[0].PlacementList, ["p0", "p1", "p2"])
+
+    def test_other_size(self):
+        addLinkArrayElement(self.project, self.part, "M4", "p0")
+        addLinkArrayElement(self.project, self.part, "M5", "p1")
+        addLinkArrayElement(self.project, self.part, "M5", "p2")
+        self.assertEqual(sorted(x.Diameter for x in self.arrays()),
+                         ["M4", "M5"])
+
+    def test_merge(self):
+        for n in range(2):
+            link = self.project.addObject("App::Link", "ToolboxPart")
+            link.LinkedObject = self.part
+            link.Diameter = "M4"
+            link.Placement = f"p{n}"
+        addLinkArrayElement(self.project, self.part, "M4", "p2")
+        self.assertEqual(mergeDuplicateParts(self.project), 2)
+        arrays = self.arrays()
+        self.assertEqual(len(arrays), 1)
+        self.assertEqual(arrays[0].PlacementList, ["p2", "p0", "p1"])
+
+
+if __name__ == "__main__":
+    unittest.main()